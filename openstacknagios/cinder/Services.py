@@ -20,6 +20,8 @@
   Nagios/Icinga plugin to check running cinder agents/services.
 
   This corresponds to the output of 'cinder service-list'.
+  With --per_host every service (e.g. each cinder-volume 'host@backend') is
+  also evaluated on its own.
 """
 
 import openstacknagios.openstacknagios as osnag
@@ -29,9 +31,10 @@ class CinderServices(osnag.Resource):
     """
     Determines the status of the cinder agents/services.
     """
-    def __init__(self, binary=None, host=None, args=None):
-        self.binary = binary
-        self.host   = host
+    def __init__(self, binary=None, host=None, per_host=False, args=None):
+        self.binary   = binary
+        self.host     = host
+        self.per_host = per_host
         osnag.Resource.__init__(self, args)
 
     def probe(self):
@@ -41,21 +44,28 @@ class CinderServices(osnag.Resource):
            self.exit_error(str(e))
 
         try:
-           result = cinder.services.list()
+           result = cinder.services.list(host=self.host, binary=self.binary)
         except Exception as e:
            self.exit_error(str(e))
 
         stati = dict(up=0, disabled=0, down=0, total=0)
 
         for agent in result:
-           if (self.host == None or self.host == agent.host) and (self.binary == None or self.binary == agent.binary):
-                stati['total'] += 1
-                if agent.status == 'enabled' and agent.state =='up':
-                     stati['up'] += 1
-                elif agent.status == 'disabled':
-                     stati['disabled'] += 1
-                else:
-                     stati['down'] += 1
+           stati['total'] += 1
+           if agent.status == 'enabled' and agent.state =='up':
+                stati['up'] += 1
+                state = 0
+           elif agent.status == 'disabled':
+                stati['disabled'] += 1
+                state = 1
+           else:
+                stati['down'] += 1
+                state = 2
+
+           if self.per_host:
+                # 0 = up, 1 = disabled, 2 = down
+                yield osnag.Metric(agent.binary + ':' + agent.host, state,
+                                   min=0, max=2, context='service')
 
         for r in stati.keys():
            yield osnag.Metric(r, stati[r], min=0)
@@ -87,10 +97,20 @@ def main():
                     default=None,
                     help='filter hostname')
 
+    argp.add_argument('--per_host', action='store_true', default=False,
+                      help='also evaluate every service (binary:host, e.g. cinder-volume:node@backend) on its own, '
+                           'reporting 0 if up, 1 if disabled and 2 if down')
+    argp.add_argument('--warn_service', metavar='RANGE', default='0',
+                      help='with --per_host: return warning if the state of a service is outside RANGE (default: 0, warn if disabled)')
+    argp.add_argument('--critical_service', metavar='RANGE', default='0:1',
+                      help='with --per_host: return critical if the state of a service is outside RANGE (default: 0:1, critical if down)')
+
     args = argp.parse_args()
 
     check = osnag.Check(
-        CinderServices(args=args, host=args.host, binary=args.binary),
+        CinderServices(args=args, host=args.host, binary=args.binary,
+                       per_host=args.per_host),
+        osnag.ScalarContext('service', args.warn_service, args.critical_service),
         osnag.ScalarContext('up', args.warn, args.critical),
         osnag.ScalarContext('disabled', args.warn_disabled, args.critical_disabled),
         osnag.ScalarContext('down', args.warn_down, args.critical_down),
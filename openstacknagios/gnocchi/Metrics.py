@@ -21,26 +21,154 @@
 
   Currently supports checking for the number of measurements reported for a
   given metric for monitoring/operational purposes.
+
+  The IDs of the metric of the resources are kept in an index in the cache
+  directory, built with one resource search, so measures are fetched by
+  metric ID without resolving the metric name of every resource.
+  With --incremental only the measures newer than those seen by the previous
+  run are requested.
 """
 
 import openstacknagios.openstacknagios as osnag
 from gnocchiclient import client
+from gnocchiclient import exceptions
 from nagiosplugin import Summary as NagiosSummary
 from nagiosplugin import Ok
 
 from datetime import datetime
 from datetime import timedelta
+from os import path
+import calendar
+import hashlib
+import json
 import re
+import time
 
 class GnocchiMetricsSummary(NagiosSummary):
     def ok(self, results):
         return 'all resources reporting metrics'
 
     def problem(self, results):
-        resources = [r.metric.name for r in results if r.state != Ok]
+        resources = [r.metric.name for r in results
+                     if r.state != Ok and r.metric and r.metric.context == 'measures']
+        if not resources:
+            return str(results.first_significant)
         return '{num} resources have not reported metrics: {list}'.format(num=len(resources),
                                                                           list=', '.join(resources))
 
+class MetricIndex(object):
+    """
+    Maps resource IDs to the ID of their metric of a given name. Stored in
+    the cache directory and rebuilt with a resource search when older than
+    ttl seconds or when a resource is missing. Resources without the metric
+    are kept with a null ID.
+    """
+    PAGE_SIZE = 1000
+
+    def __init__(self, filename, ttl):
+        self.filename = filename
+        self.ttl = ttl
+        self.created = 0
+        self.metrics = {}
+        try:
+            with open(filename, 'r') as f:
+                state = json.load(f)
+            self.created, self.metrics = state['created'], state['metrics']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        self.refreshed = False
+
+    def stale(self, resources):
+        return (time.time() - self.created > self.ttl or
+                any(r not in self.metrics for r in resources))
+
+    def refresh(self, gnocchi, metric, resources):
+        metrics = dict((r, None) for r in resources)
+        marker = None
+        while True:
+            page = gnocchi.resource.search(query={'in': {'id': resources}},
+                                           limit=self.PAGE_SIZE, marker=marker)
+            for resource in page:
+                metric_id = resource.get('metrics', {}).get(metric)
+                metrics[resource['id']] = metric_id
+                if resource.get('original_resource_id') in metrics:
+                    metrics[resource['original_resource_id']] = metric_id
+            if len(page) < self.PAGE_SIZE:
+                break
+            marker = page[-1]['id']
+        self.created, self.metrics = time.time(), metrics
+        self.refreshed = True
+        osnag.write_state(self.filename, dict(created=self.created,
+                                              metrics=self.metrics))
+
+    def get(self, resource_id):
+        return self.metrics.get(resource_id)
+
+
+class MeasureState(object):
+    """
+    Periods with measures of each resource seen by the previous runs within
+    the --since window, stored in the cache directory. Per granularity only
+    the timestamp of the first period and a bit mask of the following
+    periods are kept, so periods leaving the window are dropped by shifting
+    the mask. Granularities without periods left in the window are kept
+    with an empty mask, so they are still requested.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            with open(filename, 'r') as f:
+                self.series = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.series = {}
+
+    def _load(self, resource_id):
+        return dict((float(granularity), (first, int(mask, 16)))
+                    for granularity, (first, mask)
+                    in self.series.get(resource_id, {}).items())
+
+    def starts(self, resource_id, window_start):
+        """
+        Timestamp to request the measures of a resource from per
+        granularity: its last period, which can still be updated, or the
+        window start without periods. Empty for a resource without state.
+        """
+        return dict((granularity,
+                     max(window_start, first + granularity * (mask.bit_length() - 1)))
+                    for granularity, (first, mask)
+                    in self._load(resource_id).items())
+
+    def update(self, resource_id, measures, window_start):
+        """
+        Add the measures of a resource and drop the periods which left the
+        window. Returns the number of measures within the window.
+        """
+        series = self._load(resource_id)
+        for timestamp, granularity, _ in measures:
+            timestamp = calendar.timegm(timestamp.utctimetuple())
+            first, mask = series.get(granularity, (timestamp, 0))
+            if timestamp < first:
+                mask <<= int((first - timestamp) // granularity)
+                first = timestamp
+            mask |= 1 << int((timestamp - first) // granularity)
+            series[granularity] = (first, mask)
+
+        count = 0
+        self.series[resource_id] = {}
+        for granularity, (first, mask) in series.items():
+            # like gnocchi keep the period the window starts in
+            dropped = int((window_start - first) // granularity)
+            if dropped > 0:
+                mask >>= dropped
+                first += dropped * granularity
+            count += bin(mask).count('1')
+            self.series[resource_id][repr(granularity)] = (first, '%x' % mask)
+        return count
+
+    def save(self):
+        osnag.write_state(self.filename, self.series)
+
+
 class GnocchiMetrics(osnag.Resource):
     """
     Poll the latest metric measurements and report on the total amount found
@@ -48,8 +176,12 @@ class GnocchiMetrics(osnag.Resource):
     DURATION_REGEX = re.compile(r'((?P<hours>\d+?)h)?((?P<minutes>\d+?)m)?')
 
     def __init__(self, metric=None, since=None, resources=None,
-                 resources_file=None, args=None):
+                 resources_file=None, index_ttl=None, incremental=False,
+                 args=None):
         self.metric = metric
+        self.index_ttl = index_ttl
+        self.incremental = incremental
+        self.cache_dir = args.cache_dir
         self.since = self._parse_duration(since)
         self.resources = None
 
@@ -66,23 +198,85 @@ class GnocchiMetrics(osnag.Resource):
 
     def probe(self):
         try:
-            session_options = dict(auth=self.auth_plugin)
             adapter_options = dict(interface=self.interface,
                                    region_name=self.region_name)
             gnocchi = client.Client(self.api_version,
                                     adapter_options=adapter_options,
-                                    session_options=session_options)
+                                    session=self.session)
         except Exception as e:
             self.exit_error('cannot get client: ' + str(e))
 
         now = datetime.utcnow()
         some_time_ago = now - self.since
 
-        for resource_id in self.resources:
-            measures = gnocchi.metric.get_measures(self.metric,
-                                                   resource_id=resource_id,
-                                                   start=some_time_ago)
-            yield osnag.Metric(resource_id, len(measures), context='measures', min=0)
+        index = None
+        if self.index_ttl:
+            index = MetricIndex(self._state_filename('gnocchi-index-'),
+                                self.index_ttl)
+            try:
+                if index.stale(self.resources):
+                    index.refresh(gnocchi, self.metric, self.resources)
+            except Exception as e:
+                if self.out_of_time(e):
+                    yield self.incomplete(len(self.resources))
+                    return
+                # not fatal, the measures can still be fetched by name
+                index = None
+
+        state = None
+        if self.incremental:
+            state = MeasureState(self._state_filename('gnocchi-periods-'))
+            window_start = calendar.timegm(some_time_ago.utctimetuple())
+
+        for i, resource_id in enumerate(self.resources):
+            # granularity -> start, None requests all granularities
+            starts = {None: some_time_ago}
+            if state:
+                starts = dict((granularity, datetime.utcfromtimestamp(start))
+                              for granularity, start
+                              in state.starts(resource_id, window_start).items())
+                starts = starts or {None: some_time_ago}
+            try:
+                measures = []
+                for granularity, start in starts.items():
+                    measures.extend(self._get_measures(gnocchi, index, resource_id,
+                                                       start, granularity))
+            except Exception as e:
+                if not self.out_of_time(e):
+                    raise
+                if state:
+                    state.save()
+                yield self.incomplete(len(self.resources) - i)
+                return
+            count = len(measures)
+            if state:
+                count = state.update(resource_id, measures, window_start)
+            yield osnag.Metric(resource_id, count, context='measures', min=0)
+
+        if state:
+            state.save()
+
+    def _get_measures(self, gnocchi, index, resource_id, start, granularity):
+        metric_id = index and index.get(resource_id)
+        if metric_id:
+            try:
+                return gnocchi.metric.get_measures(metric_id, start=start,
+                                                   granularity=granularity)
+            except exceptions.NotFound:
+                # metric was replaced, rebuild the index once per run
+                if not index.refreshed:
+                    index.refresh(gnocchi, self.metric, self.resources)
+        return gnocchi.metric.get_measures(self.metric,
+                                           resource_id=resource_id,
+                                           start=start,
+                                           granularity=granularity)
+
+    def _state_filename(self, prefix):
+        auth_url = getattr(self.auth_plugin, 'auth_url', None)
+        raw = json.dumps([auth_url, self.region_name, self.interface,
+                          self.metric, sorted(self.resources)])
+        key = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        return path.join(self.cache_dir, prefix + key + '.json')
 
     def _parse_duration(self, duration_str):
         parts = self.DURATION_REGEX.match(duration_str)
@@ -114,6 +308,14 @@ def main():
                       help=('file with list of resources to poll metrics for. '
                             'Each resource should be on a separate line. '
                             'Not used if --resources is specified.'))
+    argp.add_argument('--index-ttl', metavar='SECONDS', type=int, default=3600,
+                      help=('rebuild the index of the metric IDs of the resources '
+                            'after SECONDS (default: 3600). It is also rebuilt if a '
+                            'resource is missing. 0 disables the index and '
+                            'resolves the metric name of every resource.'))
+    argp.add_argument('--incremental', action='store_true', default=False,
+                      help=('remember the measures seen within the --since window '
+                            'in the cache directory and only request newer measures'))
 
     argp.add_argument('-w', '--warn', metavar='RANGE', default='1:',
                       help='return warning if number of metrics is outside RANGE (default: 1:, warn if 0)')
@@ -126,6 +328,8 @@ def main():
         GnocchiMetrics(metric=args.metric, since=args.since,
                        resources=args.resources,
                        resources_file=args.resources_file,
+                       index_ttl=args.index_ttl,
+                       incremental=args.incremental,
                        args=args),
         osnag.ScalarContext('measures', args.warn, args.critical),
         GnocchiMetricsSummary())
@@ -0,0 +1,171 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+  Nagios/Icinga plugin to check gnocchi statistics.
+
+  Returns the statistic of the chosen metric over all resources matching a
+  query (e.g. all instances of a flavor), aggregated by gnocchi with one
+  request to the aggregates API. This also returns the age of the last
+  aggregated measure, so this check can also be used to verify freshness
+  of the measures in gnocchi (or of course to check the value).
+"""
+
+import openstacknagios.openstacknagios as osnag
+from gnocchiclient import client
+
+import calendar
+import datetime
+import time
+
+# --aggregate -> (aggregation across the resources done by gnocchi,
+#                 reduction of the aggregated series over the time frame)
+AGGREGATES = {
+    'avg':   ('mean',  lambda values: sum(values) / float(len(values))),
+    'sum':   ('sum',   sum),
+    'count': ('count', sum),
+    'min':   ('min',   min),
+    'max':   ('max',   max),
+}
+
+class GnocchiStatistics(osnag.Resource):
+    """
+    Aggregates a metric over the resources of a query.
+    """
+    def __init__(self, metric=None, resource_type=None, query=None,
+                 tframe=None, aggregate=None, aggregation=None,
+                 granularity=None, args=None):
+        self.metric        = metric
+        self.resource_type = resource_type
+        self.query         = query
+        self.tframe        = datetime.timedelta(minutes=int(tframe))
+        self.aggregate     = aggregate
+        self.aggregation   = aggregation
+        self.granularity   = granularity
+        self.verbose       = args.verbose
+        osnag.Resource.__init__(self, args=args)
+
+    def probe(self):
+        try:
+            adapter_options = dict(interface=self.interface,
+                                   region_name=self.region_name)
+            gnocchi = client.Client(self.api_version,
+                                    adapter_options=adapter_options,
+                                    session=self.session)
+        except Exception as e:
+            self.exit_error('cannot get client: ' + str(e))
+
+        method, reduce_series = AGGREGATES[self.aggregate]
+        operations = '(aggregate %s (metric %s %s))' % (method, self.metric,
+                                                        self.aggregation)
+        # without query: all resources of the type which still exist
+        search = self.query or {'=': {'ended_at': None}}
+        start = datetime.datetime.utcnow() - self.tframe
+
+        try:
+            result = gnocchi.aggregates.fetch(operations, search=search,
+                                              resource_type=self.resource_type,
+                                              start=start,
+                                              granularity=self.granularity,
+                                              needed_overlap=0)
+        except Exception as e:
+            self.exit_error('cannot load: ' + str(e))
+
+        measures = result['measures'].get('aggregated', [])
+        if measures and not self.granularity:
+            # all granularities of the archive policy are returned, use the finest
+            finest = min(g for _, g, _ in measures)
+            measures = [m for m in measures if m[1] == finest]
+
+        # periods of the aggregated series, not samples: gnocchi has already
+        # reduced the measures of each period to one value
+        yield osnag.Metric('periods', len(measures), min=0)
+        if not measures:
+            return
+
+        timestamp, granularity, _ = measures[-1]
+        # the timestamp is the start of the last period, its measures are
+        # at most granularity seconds older than its end
+        end = calendar.timegm(timestamp.utctimetuple()) + granularity
+        age = max(time.time() - end, 0)
+        yield osnag.Metric('age', age / 60, uom='m')
+        yield osnag.Metric('value', reduce_series([v for _, _, v in measures]))
+
+        if self.verbose:
+            print
+            print 'operations:     %s' % operations
+            print 'search:         %s' % search
+            print 'query start     %s' % start.isoformat()
+            print 'granularity:    %s seconds' % granularity
+            print 'last period:    %s' % timestamp.isoformat()
+            print 'age             %s minutes' % str(age / 60)
+            print 'periods:        %s' % len(measures)
+            print
+
+
+@osnag.guarded
+def main():
+    argp = osnag.ArgumentParser(description=__doc__)
+
+    # gnocchi only supports v1
+    argp.set_defaults(os_api_version='1')
+
+    argp.add_argument('-m', '--metric', metavar='METRIC_NAME', required=True,
+                      help='metric name (required)')
+    argp.add_argument('--resource_type', default='generic',
+                      help='type of the resources to aggregate (default: generic)')
+    argp.add_argument('-q', '--query', default=None,
+                      help='gnocchi query selecting the resources to aggregate, '
+                           'e.g. "flavor_id=\'1\'" (default: all resources of the type which did not end)')
+    argp.add_argument('-t', '--tframe', metavar='VALUE', type=int, default=60,
+                      help='Time frame to look back in minutes')
+    argp.add_argument('--aggregation', default='mean',
+                      help='aggregation method of the archive policy of the metric to use (default: mean)')
+    argp.add_argument('--granularity', metavar='SECONDS', type=int, default=None,
+                      help='granularity to use (default: the finest granularity of the archive policy)')
+
+    argp.add_argument('-w', '--warn', metavar='RANGE', default='0:',
+                      help='return warning if value is outside RANGE (default: 0:, never warn)')
+    argp.add_argument('-c', '--critical', metavar='RANGE', default='0:',
+                      help='return critical if value is outside RANGE (default 0:, never critical)')
+
+    argp.add_argument('--warn_periods', metavar='RANGE', default='0:',
+                      help='return warning if the number of aggregated periods in the time frame is outside RANGE (default: 0:, never warn')
+    argp.add_argument('--critical_periods', metavar='RANGE', default='0:',
+                      help='return critical if the number of aggregated periods in the time frame is outside RANGE (default: 0:, never critical')
+
+    argp.add_argument('--warn_age', metavar='RANGE', default='0:',
+                      help='return warning if the age in minutes of the last value is outside RANGE (e.g. 0:30, warn if older than 30 minutes')
+    argp.add_argument('--critical_age', metavar='RANGE', default='0:',
+                      help='return critical if the age in minutes of the last value is outside RANGE (e.g. 0:60, critical if older than 1 hour')
+
+    argp.add_argument('--aggregate', default='avg', choices=sorted(AGGREGATES),
+                      help='Aggregate function to use across the resources and the time frame (avg is the default)')
+
+    args = argp.parse_args()
+
+    check = osnag.Check(
+        GnocchiStatistics(metric=args.metric, resource_type=args.resource_type,
+                          query=args.query, tframe=args.tframe,
+                          aggregate=args.aggregate, aggregation=args.aggregation,
+                          granularity=args.granularity, args=args),
+        osnag.ScalarContext('age', args.warn_age, args.critical_age),
+        osnag.ScalarContext('periods', args.warn_periods, args.critical_periods),
+        osnag.ScalarContext('value', args.warn, args.critical),
+        osnag.Summary(show=['age','periods','value']))
+    check.main(verbose=args.verbose, timeout=args.timeout)
+
+if __name__ == '__main__':
+    main()
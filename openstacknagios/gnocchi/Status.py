@@ -20,27 +20,72 @@
   Nagios/Icinga plugin to check gnocchi status.
 
   Checks that number of pending measurements is within a given threshold.
+  With --details the backlog is broken down per metric, showing whether a
+  few metrics or the whole deployment are lagging behind.
 """
 
 import openstacknagios.openstacknagios as osnag
 from gnocchiclient import client
 
+import heapq
+import logging
+from operator import itemgetter
+
+_log = logging.getLogger('nagiosplugin')
+
 class GnocchiStatus(osnag.Resource):
+    """
+    Determines the number of measures not yet processed by metricd.
+    """
+    def __init__(self, details=False, top=5, args=None):
+        self.details = details
+        self.top = top
+        osnag.Resource.__init__(self, args)
+
     def probe(self):
         try:
-            session_options = dict(auth=self.auth_plugin)
             adapter_options = dict(interface=self.interface,
                                    region_name=self.region_name)
             gnocchi = client.Client(self.api_version,
                                     adapter_options=adapter_options,
-                                    session_options=session_options)
+                                    session=self.session)
         except Exception as e:
             self.exit_error('cannot get client: ' + str(e))
 
-        status = gnocchi.status.get()
+        status = gnocchi.status.get(details=self.details)
         measures = status.get('storage', {}).get('summary', {}).get('measures')
         yield osnag.Metric('measures_to_process', measures)
 
+        if self.details:
+            for m in self._backlog_metrics(status, measures):
+                yield m
+
+    def _backlog_metrics(self, status, measures):
+        backlog = status.get('storage', {}).get('measures_to_process') or {}
+
+        # nlargest keeps a heap of self.top entries only, the details map
+        # is never copied or sorted as a whole.
+        metrics = 0
+        for count in backlog.itervalues():
+            if count:
+                metrics += 1
+        top = heapq.nlargest(self.top, backlog.iteritems(), key=itemgetter(1))
+
+        for metric_id, count in top:
+            _log.info('metric %s: %d measures to process', metric_id, count)
+
+        largest = top[0][1] if top else 0
+        largest_percent = 100.0 * largest / measures if measures else 0
+        workers = len(status.get('metricd', {}).get('processors') or [])
+        per_worker = float(measures or 0) / workers if workers else measures
+
+        yield osnag.Metric('metrics_to_process', metrics, min=0)
+        yield osnag.Metric('largest_backlog', largest, min=0)
+        yield osnag.Metric('largest_backlog_percent', largest_percent,
+                           min=0, max=100, uom='%')
+        yield osnag.Metric('metricd_workers', workers, min=0)
+        yield osnag.Metric('measures_per_worker', per_worker, min=0)
+
 @osnag.guarded
 def main():
     argp = osnag.ArgumentParser(description=__doc__)
@@ -54,12 +99,43 @@ def main():
     argp.add_argument('-c', '--critical', metavar='RANGE', default='0:',
                       help='return critical if number of metrics is outside RANGE (default 0:, never critical)')
 
+    argp.add_argument('--details', action='store_true', default=False,
+                      help='request the per metric backlog and report metrics_to_process, '
+                           'largest_backlog(_percent), metricd_workers and measures_per_worker')
+    argp.add_argument('--top', metavar='N', type=int, default=5,
+                      help='number of metrics with the largest backlog to list in verbose output (default: 5)')
+    argp.add_argument('--warn_metrics', metavar='RANGE', default='0:',
+                      help='return warning if number of metrics with pending measures is outside RANGE (default: 0:, never warn)')
+    argp.add_argument('--critical_metrics', metavar='RANGE', default='0:',
+                      help='return critical if number of metrics with pending measures is outside RANGE (default: 0:, never critical)')
+    argp.add_argument('--warn_largest_percent', metavar='RANGE', default='0:',
+                      help='return warning if the share of the largest backlog in all pending measures is outside RANGE (default: 0:, never warn)')
+    argp.add_argument('--critical_largest_percent', metavar='RANGE', default='0:',
+                      help='return critical if the share of the largest backlog in all pending measures is outside RANGE (default: 0:, never critical)')
+    argp.add_argument('--warn_workers', metavar='RANGE', default='0:',
+                      help='return warning if number of metricd workers is outside RANGE (default: 0:, never warn)')
+    argp.add_argument('--critical_workers', metavar='RANGE', default='0:',
+                      help='return critical if number of metricd workers is outside RANGE (default: 0:, never critical)')
+    argp.add_argument('--warn_per_worker', metavar='RANGE', default='0:',
+                      help='return warning if pending measures per metricd worker is outside RANGE (default: 0:, never warn)')
+    argp.add_argument('--critical_per_worker', metavar='RANGE', default='0:',
+                      help='return critical if pending measures per metricd worker is outside RANGE (default: 0:, never critical)')
+
     args = argp.parse_args()
 
+    show = ['measures_to_process']
+    if args.details:
+        show += ['metrics_to_process', 'largest_backlog', 'metricd_workers']
+
     check = osnag.Check(
-        GnocchiStatus(args=args),
+        GnocchiStatus(details=args.details, top=args.top, args=args),
         osnag.ScalarContext('measures_to_process', args.warn, args.critical),
-        osnag.Summary(show=['measures_to_process']))
+        osnag.ScalarContext('metrics_to_process', args.warn_metrics, args.critical_metrics),
+        osnag.ScalarContext('largest_backlog'),
+        osnag.ScalarContext('largest_backlog_percent', args.warn_largest_percent, args.critical_largest_percent),
+        osnag.ScalarContext('metricd_workers', args.warn_workers, args.critical_workers),
+        osnag.ScalarContext('measures_per_worker', args.warn_per_worker, args.critical_per_worker),
+        osnag.Summary(show=show))
     check.main(verbose=args.verbose, timeout=args.timeout)
 
 if __name__ == '__main__':
@@ -16,8 +16,6 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import subprocess
-import json
 import openstacknagios.openstacknagios as osnag
 
 class Consoles(osnag.Resource):
@@ -26,21 +24,17 @@ class Consoles(osnag.Resource):
     """
 
     def probe(self):
-        # Getting the Python Ironic client to talk SSL is a dark art
-        # Use the command line client instead
-        try:
-            cmd = "ironic --json node-list --detail --associated=true"
-            out = subprocess.check_output(cmd, shell=True)
-            nodes = json.loads(out)
+        stati = dict(disabled=0, total=0)
 
+        try:
+            for node in self.paginate('baremetal', '/v1/nodes/detail', 'nodes',
+                                      associated=True):
+                stati['total'] += 1
+                if not node['console_enabled']:
+                    stati['disabled'] += 1
         except Exception as e:
             self.exit_error(str(e))
 
-        stati = dict(disabled=0, total=0)
-        stati['total'] = len(nodes)
-        disabled = [x for x in nodes if not x[u'console_enabled']]
-        stati['disabled'] = len(disabled)
-
         for r in stati.keys():
             yield osnag.Metric(r, stati[r], min=0)
 
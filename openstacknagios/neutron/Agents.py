@@ -19,10 +19,19 @@
 """
  Nagios/Icinga plugin to check running neutron agents.
  This corresponds to the output of 'neutron agent-list'.
+
+ Also reports the maximum and 95th percentile of the heartbeat age of the
+ agents per binary, growing heartbeat ages are an early sign of an
+ overloaded message bus.
 """
 
+import time
+
 import openstacknagios.openstacknagios as osnag
-from neutronclient.neutron import client
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(round(p / 100.0 * (len(values) - 1)))]
 
 class NeutronAgents(osnag.Resource):
     """
@@ -34,19 +43,21 @@ class NeutronAgents(osnag.Resource):
         osnag.Resource.__init__(self, args)
 
     def probe(self):
-        try:
-           neutron = client.Client(self.api_version, session=self.session, region_name=self.region_name)
-        except Exception as e:
-           self.exit_error('cannot load ' + str(e))
-
-        try:
-           result = neutron.list_agents(host=self.host, binary=self.binary)
-        except Exception as e:
-           self.exit_error('list_agents: ' + str(e))
-
         stati = dict(up=0, disabled=0, down=0, total=0)
+        ages = dict()
+        now = int(time.time())
+
+        agents = self.paginate('network', '/v2.0/agents', 'agents',
+                               host=self.host, binary=self.binary)
+        while True:
+           # only errors of the API requests are reported as such
+           try:
+              agent = next(agents)
+           except StopIteration:
+              break
+           except Exception as e:
+              self.exit_error('list_agents: ' + str(e))
 
-        for agent in result['agents']:
            stati['total'] += 1
            if agent['admin_state_up'] and agent['alive'] :
                 stati['up'] += 1
@@ -55,9 +66,19 @@ class NeutronAgents(osnag.Resource):
            else:
                 stati['down'] += 1
 
+           if agent['admin_state_up'] and agent.get('heartbeat_timestamp'):
+                ages.setdefault(agent['binary'], []).append(
+                    osnag.timestamp_age(agent['heartbeat_timestamp'], now))
+
         for r in stati.keys():
            yield osnag.Metric(r, stati[r], min=0)
 
+        for binary in sorted(ages):
+           yield osnag.Metric(binary + '_heartbeat_max', max(ages[binary]),
+                              uom='s', min=0, context='heartbeat_max')
+           yield osnag.Metric(binary + '_heartbeat_p95', percentile(ages[binary], 95),
+                              uom='s', min=0, context='heartbeat_p95')
+
 
 @osnag.guarded
 def main():
@@ -86,6 +107,15 @@ def main():
                     default='',
                     help='filter hostname')
 
+    argp.add_argument('--warn_heartbeat', metavar='RANGE', default='0:',
+                      help='return warning if the maximum heartbeat age (in seconds) of the agents of a binary is outside RANGE (default: 0:, never warn)')
+    argp.add_argument('--critical_heartbeat', metavar='RANGE', default='0:',
+                      help='return critical if the maximum heartbeat age (in seconds) of the agents of a binary is outside RANGE (default: 0:, never critical)')
+    argp.add_argument('--warn_heartbeat_p95', metavar='RANGE', default='0:',
+                      help='return warning if the 95th percentile heartbeat age (in seconds) of the agents of a binary is outside RANGE (default: 0:, never warn)')
+    argp.add_argument('--critical_heartbeat_p95', metavar='RANGE', default='0:',
+                      help='return critical if the 95th percentile heartbeat age (in seconds) of the agents of a binary is outside RANGE (default: 0:, never critical)')
+
     args = argp.parse_args()
 
     check = osnag.Check(
@@ -94,6 +124,8 @@ def main():
         osnag.ScalarContext('disabled', args.warn_disabled, args.critical_disabled),
         osnag.ScalarContext('down', args.warn_down, args.critical_down),
         osnag.ScalarContext('total', '0:', '@0'),
+        osnag.ScalarContext('heartbeat_max', args.warn_heartbeat, args.critical_heartbeat),
+        osnag.ScalarContext('heartbeat_p95', args.warn_heartbeat_p95, args.critical_heartbeat_p95),
         osnag.Summary(show=['up','disabled','down']))
     check.main(verbose=args.verbose, timeout=args.timeout)
 
@@ -23,30 +23,23 @@
 """
 
 import openstacknagios.openstacknagios as osnag
-from neutronclient.neutron import client
 
 class NeutronFloatingips(osnag.Resource):
     """
     Determines the number of assigned (used and unused) floating ip's
     """
     def probe(self):
-        try:
-           neutron = client.Client(self.api_version, session=self.session, region_name=self.region_name)
-        except Exception as e:
-           self.exit_error('cannot load ' + str(e))
+        stati=dict(assigned=0, used=0)
 
         try:
-           result = neutron.list_floatingips()
+           for floatingip in self.paginate('network', '/v2.0/floatingips', 'floatingips',
+                                           fields=['id', 'fixed_ip_address']):
+              stati['assigned'] += 1
+              if floatingip['fixed_ip_address']:
+                stati['used'] += 1
         except Exception as e:
            self.exit_error(str(e))
 
-        stati=dict(assigned=0, used=0)
-
-        for floatingip in result['floatingips']:
-           stati['assigned'] += 1
-           if floatingip['fixed_ip_address']:
-             stati['used'] += 1
-
         for r in stati.keys():
            yield osnag.Metric(r, stati[r], min=0)
 
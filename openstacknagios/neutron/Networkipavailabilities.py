@@ -16,17 +16,43 @@
    Nagios/Icinga plugin to check available ip's.
 
    This corresponds to the output of 'openstack ip availabilities show'.
+   With --all the ip availabilities of all (filtered) networks and their
+   subnets are checked with a single 'openstack ip availabilities list'.
 """
 
+import re
+
 import openstacknagios.openstacknagios as osnag
 from neutronclient.neutron import client
+from nagiosplugin import Summary as NagiosSummary
+from nagiosplugin import Ok
+
+class NetworkipavailabilitiesSummary(NagiosSummary):
+    def ok(self, results):
+        percent = [r.metric for r in results if r.metric.context == 'percent']
+        if not percent:
+            return 'no networks found'
+        worst = max(percent, key=lambda m: m.value)
+        return '{num} networks/subnets, highest usage {name}: {value:.1f}%'.format(
+            num=len(percent), name=worst.name[:-len('_percent')], value=worst.value)
+
+    def problem(self, results):
+        names = ['{0}:{1:.1f}%'.format(r.metric.name[:-len('_percent')], r.metric.value)
+                 for r in results if r.state != Ok and r.metric]
+        return '{num} networks/subnets with ip usage outside range: {list}'.format(
+            num=len(names), list=', '.join(names))
 
 class NeutronNetworkipavailabilities(osnag.Resource):
     """
     Determines the number of total and used neutron network ip's
     """
-    def __init__(self, network_uuid=None, args=None):
+    def __init__(self, network_uuid=None, all_networks=False, external=False,
+                 project=None, name_pattern=None, args=None):
         self.network_uuid = network_uuid
+        self.all_networks = all_networks
+        self.external = external
+        self.project = project
+        self.name_pattern = re.compile(name_pattern) if name_pattern else None
         osnag.Resource.__init__(self, args)
 
     def probe(self):
@@ -35,6 +61,11 @@ class NeutronNetworkipavailabilities(osnag.Resource):
         except Exception as e:
             self.exit_error('cannot load ' + str(e))
 
+        if self.all_networks:
+            for m in self._probe_all(neutron):
+                yield m
+            return
+
         try:
             result = neutron.show_network_ip_availability(self.network_uuid)
         except Exception as e:
@@ -49,6 +80,51 @@ class NeutronNetworkipavailabilities(osnag.Resource):
         for r in stati.keys():
             yield osnag.Metric(r, stati[r], min=0)
 
+    def _probe_all(self, neutron):
+        params = {}
+        if self.project:
+            params['project_id'] = self.project
+
+        try:
+            if self.external:
+                external = neutron.list_networks(fields='id', **{'router:external': True})
+                external = set(n['id'] for n in external['networks'])
+            result = neutron.list_network_ip_availabilities(**params)
+        except Exception as e:
+            self.exit_error(str(e))
+
+        for net_ip in result['network_ip_availabilities']:
+            if self.external and net_ip['network_id'] not in external:
+                continue
+            name = net_ip.get('network_name') or net_ip['network_id']
+            if self.name_pattern and not self.name_pattern.search(name):
+                continue
+
+            # names are not unique (e.g. 'private' in every project)
+            label = self._label(net_ip.get('network_name'), net_ip['network_id'])
+            for m in self._usage(label, net_ip):
+                yield m
+            for subnet in net_ip.get('subnet_ip_availability', []):
+                subnet_label = name + '/' + self._label(subnet.get('subnet_name'),
+                                                        subnet['subnet_id'])
+                for m in self._usage(subnet_label, subnet):
+                    yield m
+
+    def _label(self, name, uuid):
+        if name:
+            return name + ':' + uuid
+        return uuid
+
+    def _usage(self, name, availability):
+        total = availability['total_ips']
+        used = availability['used_ips']
+        percent = 100.0 * used / total if total else 0
+
+        yield osnag.Metric(name + '_total', total, min=0, context='ips')
+        yield osnag.Metric(name + '_used', used, min=0, max=total, context='ips')
+        yield osnag.Metric(name + '_percent', percent, min=0, max=100, uom='%',
+                           context='percent')
+
 @osnag.guarded
 def main():
     argp = osnag.ArgumentParser(description=__doc__)
@@ -57,14 +133,43 @@ def main():
                       help='return warning if number of used ip\'s is outside range (default: 0:200, warn if more than 200 are used)')
     argp.add_argument('-c', '--critical', metavar='RANGE', default='0:230',
                       help='return critical if number of used ip\'s is outside RANGE (default 0:230, critical if more than 230 are used)')
-    argp.add_argument('-n', '--network_uuid', required=True, help='network_uuid to check')
+    argp.add_argument('-n', '--network_uuid', help='network_uuid to check')
+
+    argp.add_argument('--all', dest='all_networks', action='store_true', default=False,
+                      help='check all networks and their subnets with one request instead of --network_uuid')
+    argp.add_argument('--warn_percent', metavar='RANGE', default='0:80',
+                      help='with --all: return warning if percentage of used ip\'s of a network or subnet is outside RANGE (default: 0:80)')
+    argp.add_argument('--critical_percent', metavar='RANGE', default='0:90',
+                      help='with --all: return critical if percentage of used ip\'s of a network or subnet is outside RANGE (default: 0:90)')
+    argp.add_argument('--external', action='store_true', default=False,
+                      help='with --all: only check external (router:external) networks')
+    argp.add_argument('--project', default=None,
+                      help='with --all: only check networks of this project id')
+    argp.add_argument('--name_pattern', metavar='REGEX', default=None,
+                      help='with --all: only check networks whose name matches REGEX')
     args = argp.parse_args()
 
-    check = osnag.Check(
-        NeutronNetworkipavailabilities(network_uuid=args.network_uuid, args=args),
-        osnag.ScalarContext('total'),
-        osnag.ScalarContext('used', args.warn, args.critical),
-        osnag.Summary(show=['total','used']))
+    if not args.all_networks and not args.network_uuid:
+        argp.error('either --network_uuid or --all is required')
+
+    resource = NeutronNetworkipavailabilities(network_uuid=args.network_uuid,
+                                              all_networks=args.all_networks,
+                                              external=args.external,
+                                              project=args.project,
+                                              name_pattern=args.name_pattern,
+                                              args=args)
+    if args.all_networks:
+        check = osnag.Check(
+            resource,
+            osnag.ScalarContext('ips'),
+            osnag.ScalarContext('percent', args.warn_percent, args.critical_percent),
+            NetworkipavailabilitiesSummary())
+    else:
+        check = osnag.Check(
+            resource,
+            osnag.ScalarContext('total'),
+            osnag.ScalarContext('used', args.warn, args.critical),
+            osnag.Summary(show=['total','used']))
     check.main(verbose=args.verbose, timeout=args.timeout)
 
 if __name__ == '__main__':
@@ -21,39 +21,97 @@
    plugin will **NOT** work for neutron servers without astara extensions.
 
    This corresponds to the output of 'neutron router-list -c id -c status'.
+
+   With --hosting the L3 agents hosting each router are checked as well:
+   routers without alive agent, non HA routers on more than one agent and
+   HA routers on fewer than --ha_min_hosts alive agents are counted. The
+   routers of each L3 agent are listed instead of the agents of each
+   router, so the number of requests grows with the agents.
 """
 
+import logging
+
 import openstacknagios.openstacknagios as osnag
-from neutronclient.neutron import client
+
+_log = logging.getLogger('nagiosplugin')
 
 class NeutronRouters(osnag.Resource):
     """
     Determines the number down/build/active routers
     """
+    def __init__(self, hosting=False, ha_min_hosts=2, args=None):
+        self.hosting = hosting
+        self.ha_min_hosts = ha_min_hosts
+        osnag.Resource.__init__(self, args)
 
     def probe(self):
+        stati = dict(active=0, down=0, build=0)
+        routers = dict()
+
+        fields = ['id', 'status']
+        if self.hosting:
+            fields += ['ha']
+
         try:
-            neutron = client.Client(self.api_version, session=self.session, region_name=self.region_name)
+            for router in self.paginate('network', '/v2.0/routers', 'routers',
+                                        fields=fields):
+                if router['status'] == 'ACTIVE':
+                    stati['active'] += 1
+                if router['status'] == 'DOWN':
+                    stati['down'] += 1
+                if router['status'] == 'BUILD':
+                    stati['build'] += 1
+                if self.hosting:
+                    routers[router['id']] = bool(router.get('ha'))
         except Exception as e:
-            self.exit_error('cannot load ' + str(e))
+            self.exit_error(str(e))
 
+        for r in stati.keys():
+            yield osnag.Metric(r, stati[r], min=0)
+
+        if self.hosting:
+            for metric in self.probe_hosting(routers):
+                yield metric
+
+    def probe_hosting(self, routers):
+        """
+        Count the alive L3 agents hosting each router, with one request
+        per L3 agent.
+        """
+        hosts = dict((router_id, 0) for router_id in routers)
         try:
-            result = neutron.list_routers()
+            agents = list(self.paginate('network', '/v2.0/agents', 'agents',
+                                        agent_type='L3 agent'))
+            for agent in agents:
+                if not (agent['alive'] and agent['admin_state_up']):
+                    continue
+                # agents in dvr mode only serve the distributed part of
+                # routers, the centralized part runs on a dvr_snat agent
+                if (agent.get('configurations') or {}).get('agent_mode') == 'dvr':
+                    continue
+                resp = self.session.get('/v2.0/agents/%s/l3-routers' % agent['id'],
+                                        endpoint_filter=self.endpoint_filter('network'))
+                for router in resp.json()['routers']:
+                    if router['id'] in hosts:
+                        hosts[router['id']] += 1
         except Exception as e:
             self.exit_error(str(e))
 
-        stati = dict(active=0, down=0, build=0)
-
-        for router in result['routers']:
-            if router['status'] == 'ACTIVE':
-                stati['active'] += 1
-            if router['status'] == 'DOWN':
-                stati['down'] += 1
-            if router['status'] == 'BUILD':
-                stati['build'] += 1
+        problems = dict(unhosted=[], multihosted=[], ha_degraded=[])
+        for router_id, count in hosts.items():
+            ha = routers[router_id]
+            if count == 0:
+                problems['unhosted'].append(router_id)
+            elif ha and count < self.ha_min_hosts:
+                problems['ha_degraded'].append(router_id)
+            elif not ha and count > 1:
+                problems['multihosted'].append(router_id)
 
-        for r in stati.keys():
-            yield osnag.Metric(r, stati[r], min=0)
+        yield osnag.Metric('l3_agents', len(agents), min=0)
+        for name, ids in sorted(problems.items()):
+            if ids:
+                _log.info('%s routers: %s', name, ', '.join(sorted(ids)))
+            yield osnag.Metric(name, len(ids), min=0)
 
 
 @osnag.guarded
@@ -73,14 +131,53 @@ def main():
                       help="""return critical if number of building routers
                       is greater than (default: 10) """)
 
+    argp.add_argument('--hosting', action='store_true', default=False,
+                      help="""also check the L3 agents hosting the routers,
+                      listing the routers of each L3 agent (admin only)""")
+    argp.add_argument('--ha_min_hosts', metavar='N', type=int, default=2,
+                      help="""with --hosting: number of alive L3 agents an HA
+                      router should be hosted on (default: 2)""")
+    argp.add_argument('--warn_unhosted', metavar='RANGE', default='0:',
+                      help="""with --hosting: return warning if number of routers
+                      without alive L3 agent is outside RANGE (default: 0:, never warn)""")
+    argp.add_argument('--critical_unhosted', metavar='RANGE', default='0',
+                      help="""with --hosting: return critical if number of routers
+                      without alive L3 agent is outside RANGE (default: 0, critical
+                      if any)""")
+    argp.add_argument('--warn_multihosted', metavar='RANGE', default='0',
+                      help="""with --hosting: return warning if number of non HA
+                      routers on more than one L3 agent is outside RANGE (default:
+                      0, warn if any)""")
+    argp.add_argument('--critical_multihosted', metavar='RANGE', default='0:',
+                      help="""with --hosting: return critical if number of non HA
+                      routers on more than one L3 agent is outside RANGE (default:
+                      0:, never critical)""")
+    argp.add_argument('--warn_ha_degraded', metavar='RANGE', default='0',
+                      help="""with --hosting: return warning if number of HA routers
+                      on fewer than --ha_min_hosts L3 agents is outside RANGE
+                      (default: 0, warn if any)""")
+    argp.add_argument('--critical_ha_degraded', metavar='RANGE', default='0:',
+                      help="""with --hosting: return critical if number of HA routers
+                      on fewer than --ha_min_hosts L3 agents is outside RANGE
+                      (default: 0:, never critical)""")
+
     args = argp.parse_args()
 
+    show = ['active', 'down', 'build']
+    if args.hosting:
+        show += ['unhosted', 'multihosted', 'ha_degraded']
+
     check = osnag.Check(
-        NeutronRouters(args=args),
+        NeutronRouters(hosting=args.hosting, ha_min_hosts=args.ha_min_hosts,
+                       args=args),
         osnag.ScalarContext('active'),
         osnag.ScalarContext('down', args.warn, args.critical),
         osnag.ScalarContext('build', args.warn_build, args.critical_build),
-        osnag.Summary(show=['active', 'down', 'build']))
+        osnag.ScalarContext('l3_agents'),
+        osnag.ScalarContext('unhosted', args.warn_unhosted, args.critical_unhosted),
+        osnag.ScalarContext('multihosted', args.warn_multihosted, args.critical_multihosted),
+        osnag.ScalarContext('ha_degraded', args.warn_ha_degraded, args.critical_ha_degraded),
+        osnag.Summary(show=show))
     check.main(verbose=args.verbose, timeout=args.timeout)
 
 if __name__ == '__main__':
@@ -0,0 +1,193 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+    Nagios/Icinga plugin to check for nova servers stuck in a bad state.
+
+    Counts the servers in ERROR and BUILD state and those being deleted,
+    and reports for how long the oldest of each has been in that state.
+
+    The first run lists all servers, later runs only request the servers
+    changed since the previous run (changes-since) and apply them to the
+    servers in bad states kept in the cache directory, so the cost of a run
+    grows with the churn, not with the number of servers.
+"""
+
+import hashlib
+import json
+import time
+from email.utils import parsedate_tz, mktime_tz
+from os import path
+
+import openstacknagios.openstacknagios as osnag
+
+STATES = ('error', 'build', 'deleting')
+
+# servers updated while the previous listing ran, but committed later with
+# an older updated_at, are within this margin of seconds
+MARGIN = 60
+
+def bad_state(server):
+    """
+    Bad state of a server (one of STATES) or None.
+    """
+    if server.get('status') in ('DELETED', 'SOFT_DELETED'):
+        return None
+    if server.get('OS-EXT-STS:task_state') == 'deleting':
+        return 'deleting'
+    if server.get('status') == 'ERROR':
+        return 'error'
+    if server.get('status') == 'BUILD':
+        return 'build'
+    return None
+
+class NovaServers(osnag.Resource):
+    """
+    Determines the servers in bad states.
+    """
+    def __init__(self, all_tenants=False, resync=None, args=None):
+        self.all_tenants = all_tenants
+        self.resync = resync
+        self.cache_dir = args.cache_dir
+        osnag.Resource.__init__(self, args)
+
+    def probe(self):
+        filename = self._state_filename()
+        try:
+            with open(filename, 'r') as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            state = {}
+
+        now = time.time()
+        params = dict()
+        if self.all_tenants:
+            params['all_tenants'] = 1
+        servers = dict()
+        if state.get('since') and now - state.get('synced', 0) < self.resync:
+            # changes since the last run, including deleted servers
+            servers = state['servers']
+            params['changes-since'] = state['since']
+
+        # the next run lists the changes since the start of this listing
+        # (in server time): the listing is sorted by creation, so a server
+        # updated meanwhile may be on a page fetched before
+        dates = []
+        def first_date(resp):
+            if not dates:
+                dates.append(resp.headers.get('Date'))
+
+        changes = 0
+        try:
+            for server in osnag.paginate(self.session, '/servers/detail', 'servers',
+                                         page_size=self.page_size, params=params,
+                                         on_response=first_date,
+                                         endpoint_filter=self.endpoint_filter('compute')):
+                changes += 1
+                name = bad_state(server)
+                if name is None:
+                    servers.pop(server['id'], None)
+                elif servers.get(server['id'], [None])[0] != name:
+                    servers[server['id']] = [
+                        name, now - osnag.timestamp_age(server['updated'], now)]
+        except Exception as e:
+            # the state is only written after a complete listing
+            self.exit_error(str(e))
+
+        started = now
+        date = dates and dates[0] and parsedate_tz(dates[0])
+        if date:
+            started = mktime_tz(date)
+        since = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(started - MARGIN))
+
+        if 'changes-since' not in params:
+            state['synced'] = now
+        state.update(since=since, servers=servers)
+        osnag.write_state(filename, state)
+
+        counts = dict((name, 0) for name in STATES)
+        ages = dict((name, 0) for name in STATES)
+        for name, entered in servers.values():
+            counts[name] += 1
+            ages[name] = max(ages[name], now - entered)
+
+        for name in STATES:
+            yield osnag.Metric(name, counts[name], min=0)
+            yield osnag.Metric(name + '_age', int(ages[name]), uom='s', min=0)
+        yield osnag.Metric('changes', changes, min=0, context='default')
+
+    def _state_filename(self):
+        # the servers listed depend on the project (and the user's roles)
+        auth_url = getattr(self.auth_plugin, 'auth_url', None)
+        raw = json.dumps([auth_url, self.session.get_project_id(),
+                          self.session.get_user_id(), self.region_name,
+                          self.interface, self.all_tenants])
+        key = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        return path.join(self.cache_dir, 'nova-servers-' + key + '.json')
+
+@osnag.guarded
+def main():
+    argp = osnag.ArgumentParser(description=__doc__)
+
+    argp.add_argument('--all_tenants', action='store_true', default=False,
+                      help='check the servers of all projects (admin only)')
+    argp.add_argument('--resync', metavar='SECONDS', type=int, default=86400,
+                      help='list all servers again after SECONDS instead of only the changed ones '
+                           '(default: 86400)')
+
+    for name, description in (('error', 'servers in ERROR state'),
+                              ('build', 'servers in BUILD state'),
+                              ('deleting', 'servers being deleted')):
+        argp.add_argument('--warn_' + name, metavar='RANGE', default='0:',
+                          help='return warning if number of %s is outside RANGE '
+                               '(default: 0:, never warn)' % description)
+        argp.add_argument('--critical_' + name, metavar='RANGE', default='0:',
+                          help='return critical if number of %s is outside RANGE '
+                               '(default: 0:, never critical)' % description)
+
+    argp.add_argument('--warn_error_age', metavar='RANGE', default='0:',
+                      help='return warning if the oldest server in ERROR state is in it for longer than '
+                           'RANGE seconds (default: 0:, never warn)')
+    argp.add_argument('--critical_error_age', metavar='RANGE', default='0:',
+                      help='return critical if the oldest server in ERROR state is in it for longer than '
+                           'RANGE seconds (default: 0:, never critical)')
+    argp.add_argument('--warn_build_age', metavar='RANGE', default='0:1800',
+                      help='return warning if the oldest server in BUILD state is in it for longer than '
+                           'RANGE seconds (default: 0:1800, warn after 30 minutes)')
+    argp.add_argument('--critical_build_age', metavar='RANGE', default='0:3600',
+                      help='return critical if the oldest server in BUILD state is in it for longer than '
+                           'RANGE seconds (default: 0:3600, critical after 1 hour)')
+    argp.add_argument('--warn_deleting_age', metavar='RANGE', default='0:1800',
+                      help='return warning if the oldest server being deleted is deleted for longer than '
+                           'RANGE seconds (default: 0:1800, warn after 30 minutes)')
+    argp.add_argument('--critical_deleting_age', metavar='RANGE', default='0:3600',
+                      help='return critical if the oldest server being deleted is deleted for longer than '
+                           'RANGE seconds (default: 0:3600, critical after 1 hour)')
+
+    args = argp.parse_args()
+
+    check = osnag.Check(
+        NovaServers(all_tenants=args.all_tenants, resync=args.resync, args=args),
+        osnag.ScalarContext('error', args.warn_error, args.critical_error),
+        osnag.ScalarContext('build', args.warn_build, args.critical_build),
+        osnag.ScalarContext('deleting', args.warn_deleting, args.critical_deleting),
+        osnag.ScalarContext('error_age', args.warn_error_age, args.critical_error_age),
+        osnag.ScalarContext('build_age', args.warn_build_age, args.critical_build_age),
+        osnag.ScalarContext('deleting_age', args.warn_deleting_age, args.critical_deleting_age),
+        osnag.Summary(show=['error', 'build', 'deleting']))
+    check.main(verbose=args.verbose, timeout=args.timeout)
+
+if __name__ == '__main__':
+    main()
@@ -20,18 +20,47 @@
     Nagios/Icinga plugin to check running nova services.
 
     This corresponds to the output of 'nova service-list'.
+    With --group_by the services are also counted per binary or availability
+    zone, together with the age of the oldest updated_at of each group.
 """
 
+import time
+
 from novaclient import client
 import openstacknagios.openstacknagios as osnag
 
+GROUP_METRICS = ('up', 'disabled', 'down', 'total', 'updated_age')
+
+def parse_group_thresholds(thresholds):
+    """
+    Parse GROUP.METRIC=WARN,CRITICAL thresholds into a dict mapping
+    'GROUP:METRIC' to (WARN, CRITICAL).
+    """
+    result = dict()
+    for threshold in thresholds or []:
+        try:
+            key, ranges = threshold.split('=', 1)
+            group, metric = key.rsplit('.', 1)
+            warn, critical = ranges.split(',', 1)
+        except ValueError:
+            raise ValueError('invalid group threshold %r, expected '
+                             'GROUP.METRIC=WARN,CRITICAL' % threshold)
+        if metric not in GROUP_METRICS:
+            raise ValueError('invalid metric %r in group threshold, expected one of %s'
+                             % (metric, ', '.join(GROUP_METRICS)))
+        result[group + ':' + metric] = (warn, critical)
+    return result
+
 class NovaServices(osnag.Resource):
     """
     Determines the status of the nova services.
     """
-    def __init__(self, binary=None, host=None, args=None):
-        self.binary = binary
-        self.host   = host
+    def __init__(self, binary=None, host=None, group_by=None,
+                 group_thresholds=None, args=None):
+        self.binary   = binary
+        self.host     = host
+        self.group_by = group_by
+        self.group_thresholds = group_thresholds or {}
         osnag.Resource.__init__(self, args)
 
     def probe(self):
@@ -46,19 +75,39 @@ class NovaServices(osnag.Resource):
            self.exit_error(str(e))
 
         stati = dict(up=0, disabled=0, down=0, total=0)
+        groups = dict()
+        now = int(time.time())
 
         for agent in result:
-           stati['total'] += 1
            if agent.status == 'enabled' and agent.state =='up':
-                stati['up'] += 1
+                state = 'up'
            elif agent.status == 'disabled':
-                stati['disabled'] += 1
+                state = 'disabled'
            else:
-                stati['down'] += 1
+                state = 'down'
+           stati['total'] += 1
+           stati[state] += 1
+
+           if self.group_by:
+                group = groups.setdefault(getattr(agent, self.group_by),
+                                          dict(up=0, disabled=0, down=0, total=0,
+                                               updated_age=0))
+                group['total'] += 1
+                group[state] += 1
+                if agent.status == 'enabled' and agent.updated_at:
+                     group['updated_age'] = max(group['updated_age'],
+                                                osnag.timestamp_age(agent.updated_at, now))
 
         for r in stati.keys():
            yield osnag.Metric(r, stati[r], min=0)
 
+        for name in sorted(groups):
+           for r, value in sorted(groups[name].items()):
+                metric = name + ':' + r
+                context = metric if metric in self.group_thresholds else r
+                yield osnag.Metric(metric, value, min=0, context=context,
+                                   uom='s' if r == 'updated_age' else None)
+
 @osnag.guarded
 def main():
     argp = osnag.ArgumentParser(description=__doc__)
@@ -86,15 +135,40 @@ def main():
                     default=None,
                     help='filter hostname')
 
+    argp.add_argument('--group_by', choices=['binary', 'zone'], default=None,
+                      help='also report up/disabled/down/total and the age of the oldest updated_at '
+                           'per binary or availability zone, from the same service list')
+    argp.add_argument('--warn_updated_age', metavar='RANGE', default='0:',
+                      help='with --group_by: return warning if the oldest updated_at of the enabled services of a group '
+                           'is more than RANGE seconds ago (default: 0:, never warn)')
+    argp.add_argument('--critical_updated_age', metavar='RANGE', default='0:',
+                      help='with --group_by: return critical if the oldest updated_at of the enabled services of a group '
+                           'is more than RANGE seconds ago (default: 0:, never critical)')
+    argp.add_argument('--group_threshold', metavar='GROUP.METRIC=WARN,CRITICAL', action='append',
+                      help='with --group_by: thresholds of one group, e.g. nova-conductor.up=3:,1: '
+                           '(METRIC is one of up, disabled, down, total, updated_age). Can be repeated. '
+                           'Groups without thresholds use the thresholds of the totals.')
+
     args = argp.parse_args()
 
+    try:
+        group_thresholds = parse_group_thresholds(args.group_threshold)
+    except ValueError as e:
+        argp.error(str(e))
+
+    group_contexts = [osnag.ScalarContext(metric, warn, critical)
+                      for metric, (warn, critical) in sorted(group_thresholds.items())]
+
     check = osnag.Check(
-        NovaServices(args=args, host=args.host, binary=args.binary),
+        NovaServices(args=args, host=args.host, binary=args.binary,
+                     group_by=args.group_by, group_thresholds=group_thresholds),
+        osnag.ScalarContext('updated_age', args.warn_updated_age, args.critical_updated_age),
         osnag.ScalarContext('up', args.warn, args.critical),
         osnag.ScalarContext('disabled', args.warn_disabled, args.critical_disabled),
         osnag.ScalarContext('down', args.warn_down, args.critical_down),
         osnag.ScalarContext('total', '0:', '@0'),
-        osnag.Summary(show=['up','disabled','down','total']))
+        osnag.Summary(show=['up','disabled','down','total']),
+        *group_contexts)
     check.main(verbose=args.verbose,  timeout=args.timeout)
 
 if __name__ == '__main__':
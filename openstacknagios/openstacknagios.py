@@ -16,41 +16,1256 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from __future__ import absolute_import
+
 from nagiosplugin import Resource as NagiosResource
 from nagiosplugin import Summary as NagiosSummary
-from nagiosplugin import Check
+from nagiosplugin import Check as NagiosCheck
 from nagiosplugin import Metric
 from nagiosplugin import guarded
+from nagiosplugin import Context
 from nagiosplugin import ScalarContext
+from nagiosplugin import Ok, Warn, Unknown
+from nagiosplugin import CheckError
+from nagiosplugin import Result
 
 from argparse import ArgumentParser as ArgArgumentParser
+from argparse import ArgumentTypeError
 
 from keystoneauth1 import adapter
 from keystoneauth1 import loading
+from keystoneauth1 import exceptions as ksa_exceptions
+from keystoneauth1 import session as ksa_session
+
+from requests import adapters as requests_adapters
+from requests import exceptions as requests_exceptions
+from requests import models as requests_models
+from requests.compat import urlencode, urlsplit
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 
 from os import environ as env
 from os import getenv
+from os import path
+import atexit
+import base64
+import calendar
+import contextlib
+import copy
+import errno
+import cProfile
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import pstats
+import random
 import sys
+import tempfile
+import threading
+import time
+
+from openstacknagios.passive import PassiveSubmitter
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from urlparse import parse_qsl
+except ImportError:
+    from urllib.parse import parse_qsl
 
 DEFAULT_AUTH_TYPE = 'v3password'
 DEFAULT_API_VERSION = '2'
+DEFAULT_CACHE_DIR = path.join(path.expanduser('~'), '.cache', 'openstacknagios')
+DEFAULT_PAGE_SIZE = 500
+
+# Share of --timeout available to API requests, the rest is kept to
+# evaluate and print whatever was collected until then.
+DEADLINE_BUDGET = 0.9
+
+START_TIME = time.time()
+
+_log = logging.getLogger('nagiosplugin')
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when the request rate limit of a service does not allow another
+    request in time and there is no cached response to serve instead.
+    """
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of sending a request to an endpoint which failed
+    repeatedly, carrying the reason of the last failure.
+    """
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised instead of sending a request once the time budget is used up.
+    """
+
+
+class Deadline(object):
+    """
+    Time budget of a check run, derived from --timeout and measured from
+    the start of the process.
+    """
+    def __init__(self, timeout, start=None):
+        self.expires = None
+        if start is None:
+            start = START_TIME
+        if timeout:
+            self.expires = start + DEADLINE_BUDGET * float(timeout)
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return self.expires - time.time()
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+
+class ResponseCache(object):
+    """
+    Stores GET responses together with their validators (ETag and
+    Last-Modified) on disk, so that later check runs can revalidate them
+    with a conditional request instead of downloading the full body again.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.stats = dict(cache_hits=0, cache_misses=0, cache_unsupported=0)
+
+    def key(self, url, endpoint_filter=None, params=None, base_url=None,
+            identity=None):
+        """
+        Key of a GET request. The cache directory is shared by all checks,
+        so the key includes the endpoint the request goes to and the user
+        and project it is sent as, and the bodies of other clouds or
+        projects are never served.
+        """
+        raw = json.dumps([url, endpoint_filter or {}, params or {}, base_url,
+                          identity], sort_keys=True)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return path.join(self.directory, 'http-' + key + '.json')
+
+    def load(self, key):
+        try:
+            with open(self._path(key), 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def store(self, key, resp):
+        entry = dict(etag=resp.headers.get('ETag'),
+                     last_modified=resp.headers.get('Last-Modified'),
+                     content_type=resp.headers.get('Content-Type'),
+                     body=base64.b64encode(resp.content).decode('ascii'))
+        write_state(self._path(key), entry)
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def response(self, entry, url):
+        """
+        Response with the cached body of entry, served without a request.
+        """
+        resp = requests_models.Response()
+        resp.status_code = 200
+        resp.reason = 'OK'
+        resp._content = base64.b64decode(entry['body'])
+        if entry.get('content_type'):
+            resp.headers['Content-Type'] = entry['content_type']
+        resp.url = url
+        return resp
+
+    def update(self, key, entry, resp):
+        """
+        Record the outcome of a (conditional) GET. A 304 response is turned
+        into a regular 200 response carrying the cached body.
+        """
+        if resp.status_code == 304 and entry:
+            self.stats['cache_hits'] += 1
+            resp.status_code = 200
+            resp._content = base64.b64decode(entry['body'])
+            if entry.get('content_type'):
+                resp.headers['Content-Type'] = entry['content_type']
+        elif resp.status_code == 200:
+            self.stats['cache_misses'] += 1
+            if resp.headers.get('ETag') or resp.headers.get('Last-Modified'):
+                self.store(key, resp)
+            else:
+                self.stats['cache_unsupported'] += 1
+                _log.info('no validators (ETag/Last-Modified) for GET %s, '
+                          '%d bytes not cacheable', resp.url,
+                          len(resp.content))
+        return resp
+
+
+class LatencyTracker(object):
+    """
+    Remembers the latencies of the last GET requests per service on disk
+    and provides their 95th percentile, used as learned hedging delay.
+    """
+    SAMPLES = 100
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.samples = {}
+        # shared by the targets probed concurrently
+        self.lock = threading.Lock()
+
+    def _path(self, service):
+        name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in service)
+        return path.join(self.directory, 'latency-' + name + '.json')
+
+    def _load(self, service):
+        if service not in self.samples:
+            try:
+                with open(self._path(service), 'r') as f:
+                    self.samples[service] = json.load(f)
+            except (IOError, OSError, ValueError):
+                self.samples[service] = []
+        return self.samples[service]
+
+    def record(self, service, latency):
+        with self.lock:
+            samples = self._load(service)
+            samples.append(latency)
+            del samples[:-self.SAMPLES]
+            write_state(self._path(service), samples)
+
+    def p95(self, service):
+        with self.lock:
+            samples = sorted(self._load(service))
+        if len(samples) < 20:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))]
+
+
+class HedgingPolicy(object):
+    """
+    Decides when a duplicate of a slow GET request is sent. The delay is
+    either fixed or the learned p95 latency of the service, at most
+    max_hedges duplicates are sent per check run.
+    """
+    def __init__(self, after, max_hedges, tracker=None):
+        self.after = after
+        self.max_hedges = max_hedges
+        self.tracker = tracker
+        self.stats = dict(hedge_fired=0, hedge_won=0, hedge_rate_limited=0)
+
+    def delay(self, service):
+        if self.stats['hedge_fired'] >= self.max_hedges:
+            return None
+        if self.after == 'auto':
+            return self.tracker.p95(service)
+        return self.after
+
+
+class RateLimiter(object):
+    """
+    Token bucket per service and endpoint, shared by all check processes
+    through a state file per bucket in the cache directory which is updated
+    under an exclusive lock. rates maps service types (or API hosts) to
+    allowed requests per second, the None key is the rate of all other
+    services. A bucket holds at most one second worth of requests (at least
+    one).
+    """
+    def __init__(self, directory, rates, max_wait):
+        self.directory = directory
+        self.rates = rates
+        self.max_wait = max_wait
+        self.stats = dict(rate_limit_waits=0, rate_limit_wait_time=0.0,
+                          rate_limit_exceeded=0)
+
+    def _path(self, bucket):
+        name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in bucket)
+        return path.join(self.directory, 'ratelimit-' + name + '.json')
+
+    @staticmethod
+    def bucket(service, endpoint):
+        """
+        Bucket of the requests to service at endpoint (host and port), so
+        the same service type of different clouds or regions is limited
+        separately.
+        """
+        if endpoint and endpoint != service:
+            return service + '@' + endpoint
+        return service
+
+    def _take(self, bucket, rate):
+        """
+        Take a token from bucket, returns 0 on success or the seconds until
+        the next token is available.
+        """
+        with locked_state(self._path(bucket)) as state:
+            burst = max(1.0, rate)
+            now = time.time()
+            tokens = min(burst, state.get('tokens', burst) +
+                         (now - state.get('time', now)) * rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            state.update(tokens=tokens, time=now)
+        return wait
+
+    def try_acquire(self, service, endpoint):
+        """
+        True if a request to service at endpoint is allowed right now,
+        without waiting.
+        """
+        rate = self.rates.get(service, self.rates.get(None))
+        if not rate:
+            return True
+        return not self._take(self.bucket(service, endpoint), rate)
+
+    def acquire(self, service, endpoint, deadline):
+        """
+        Wait until a request to service at endpoint is allowed, False if
+        this takes longer than max_wait or the remaining time of deadline.
+        """
+        rate = self.rates.get(service, self.rates.get(None))
+        if not rate:
+            return True
+        bucket = self.bucket(service, endpoint)
+        waited = 0
+        while True:
+            wait = self._take(bucket, rate)
+            if not wait:
+                if waited:
+                    self.stats['rate_limit_waits'] += 1
+                    self.stats['rate_limit_wait_time'] += waited
+                return True
+            remaining = deadline.remaining()
+            if waited + wait > self.max_wait or (remaining is not None and
+                                                  wait >= remaining):
+                self.stats['rate_limit_exceeded'] += 1
+                return False
+            time.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker(object):
+    """
+    Counts consecutive failures (connection errors, timeouts and 5xx
+    responses) per endpoint in a state file shared by all check processes.
+    After max_failures the circuit opens and requests to the endpoint fail
+    immediately with the last failure. After reset seconds a single request
+    is let through as probe, its success closes the circuit again.
+    """
+    def __init__(self, directory, max_failures, reset):
+        self.directory = directory
+        self.max_failures = max_failures
+        self.reset = reset
+
+    def _path(self, endpoint):
+        name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in endpoint)
+        return path.join(self.directory, 'circuit-' + name + '.json')
+
+    def _peek(self, endpoint):
+        """
+        State of endpoint read without lock, for the common case of no
+        failures. None if it is being written (or empty meanwhile).
+        """
+        try:
+            with open(self._path(endpoint), 'r') as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return {}
+        except ValueError:
+            return None
+
+    def before(self, endpoint, timeout):
+        """
+        Raise CircuitOpen unless a request to endpoint may be sent. Returns
+        True if the request is the probe of an open circuit, which holds
+        the probe for timeout seconds.
+        """
+        state = self._peek(endpoint)
+        if state is not None and not state.get('opened'):
+            return False
+        with locked_state(self._path(endpoint)) as state:
+            opened = state.get('opened')
+            if not opened:
+                return False
+            now = time.time()
+            if now - opened >= self.reset and state.get('probe', 0) <= now:
+                state['probe'] = now + (timeout or self.reset)
+                return True
+        raise CircuitOpen('%s unavailable, %d consecutive failures since %s '
+                          '(circuit open): %s'
+                          % (endpoint, state['failures'],
+                             time.strftime('%H:%M:%S', time.localtime(opened)),
+                             state['reason']))
+
+    def success(self, endpoint):
+        state = self._peek(endpoint)
+        if state is not None and not state.get('failures'):
+            return
+        with locked_state(self._path(endpoint)) as state:
+            if state.get('failures'):
+                if state.get('opened'):
+                    _log.info('%s recovered, closing circuit', endpoint)
+                state.clear()
+
+    def failure(self, endpoint, reason, probe):
+        with locked_state(self._path(endpoint)) as state:
+            state['failures'] = state.get('failures', 0) + 1
+            state['reason'] = reason
+            state.pop('probe', None)
+            if probe or state['failures'] >= self.max_failures:
+                state['opened'] = time.time()
+
+
+@contextlib.contextmanager
+def locked_state(filename):
+    """
+    Context manager providing the json state in filename as dict, which is
+    written back on exit if it changed. Holds an exclusive lock on the file
+    meanwhile, so several processes can update the same state.
+    """
+    makedirs(path.dirname(filename))
+    with open(filename, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            state = json.load(f)
+        except ValueError:
+            state = {}
+        original = copy.deepcopy(state)
+        yield state
+        if state != original:
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+            f.flush()
+
+
+def hedge_after_spec(spec):
+    """
+    Parse a SECONDS|auto --hedge-after argument.
+    """
+    if spec == 'auto':
+        return spec
+    try:
+        after = float(spec)
+    except ValueError:
+        after = -1
+    if after < 0:
+        raise ArgumentTypeError('invalid hedging delay %r, expected SECONDS '
+                                'or auto' % spec)
+    return after
+
+
+def rate_limit_spec(spec):
+    """
+    Parse a [SERVICE=]REQUESTS_PER_SECOND --rate-limit argument into a
+    (service, rate) tuple, service None is the rate of all services.
+    """
+    service, _, rate = spec.rpartition('=')
+    try:
+        rate = float(rate)
+    except ValueError:
+        rate = 0
+    if rate <= 0:
+        raise ArgumentTypeError('invalid rate limit %r, expected '
+                                '[SERVICE=]REQUESTS_PER_SECOND' % spec)
+    return (service or None, rate)
+
+
+class TrafficStats(object):
+    """
+    Accounts the size of responses on the wire and after decompression,
+    and the time and number of objects of decoding their json body. Only
+    if enabled, the json body is counted when the client decodes it with
+    resp.json(), bodies decoded otherwise are not counted.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stats = dict(http_requests=0, http_bytes_wire=0, http_bytes=0,
+                          json_objects=0, json_decode_time=0.0)
+
+    def record(self, method, url, resp):
+        if not self.enabled:
+            return
+        wire = 0
+        raw = getattr(resp, 'raw', None)
+        if raw is not None and hasattr(raw, 'tell'):
+            wire = raw.tell()
+        body = len(resp.content)
+
+        self.stats['http_requests'] += 1
+        self.stats['http_bytes_wire'] += wire
+        self.stats['http_bytes'] += body
+        _log.info('%s %s: %d, %d bytes on the wire (%s), %d bytes body',
+                  method, url, resp.status_code, wire,
+                  resp.headers.get('Content-Encoding', 'identity'), body)
+
+        if 'json' in resp.headers.get('Content-Type', '') and body:
+            resp.json = self._counting_json(method, url, resp)
+
+    def _counting_json(self, method, url, resp):
+        decode = resp.json
+
+        def json_(**kwargs):
+            if kwargs:
+                return decode(**kwargs)
+            counter = [0]
+
+            def count(obj):
+                counter[0] += 1
+                return obj
+            start = time.time()
+            data = json.loads(resp.text, object_hook=count)
+            decode_time = time.time() - start
+            self.stats['json_objects'] += counter[0]
+            self.stats['json_decode_time'] += decode_time
+            _log.info('%s %s: %d json objects decoded in %.4fs', method, url,
+                      counter[0], decode_time)
+            # later calls do not decode (and count) again
+            resp.json = lambda **kwargs: data
+            return data
+        return json_
+
+    def metrics(self):
+        for name, value in sorted(self.stats.items()):
+            if name.startswith('http_bytes'):
+                uom = 'B'
+            elif name.endswith('_time'):
+                uom = 's'
+            else:
+                uom = None
+            yield Metric(name, value, min=0, uom=uom, context='default')
+
+
+class FixtureAdapter(requests_adapters.HTTPAdapter):
+    """
+    Transport adapter of the session which records the HTTP traffic of a
+    check run (including authentication) into a fixture file, or replays
+    the responses of a fixture file instead of sending the requests.
+
+    Requests are matched by method and URL (query parameters in any
+    order). Several responses recorded for the same request are replayed
+    in order, the last one is repeated. latency is the delay in seconds
+    injected into every replayed response, or 'recorded' to use the
+    latencies seen while recording.
+
+    The recorded traffic is written once, when the process exits.
+    """
+    # the recorded body is stored decoded
+    SKIP_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+    # recording adapters not yet saved
+    recording = []
+
+    def __init__(self, filename, replay=False, latency=None):
+        requests_adapters.HTTPAdapter.__init__(self)
+        self.filename = filename
+        self.replay = replay
+        self.latency = latency
+        self.entries = []
+        self.responses = {}
+        self.lock = threading.Lock()
+        if replay:
+            with open(filename, 'r') as f:
+                for entry in json.load(f):
+                    key = self.key(entry['method'], entry['url'])
+                    self.responses.setdefault(key, []).append(entry)
+        else:
+            atexit.register(self.save)
+            FixtureAdapter.recording.append(self)
+
+    @staticmethod
+    def key(method, url):
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return '%s %s://%s%s?%s' % (method.upper(), parts.scheme,
+                                    parts.netloc, parts.path, query)
+
+    def send(self, request, **kwargs):
+        if self.replay:
+            return self._replay(request, kwargs.get('timeout'))
+        start = time.time()
+        resp = requests_adapters.HTTPAdapter.send(self, request, **kwargs)
+        entry = dict(method=request.method, url=request.url,
+                     status=resp.status_code, reason=resp.reason,
+                     headers=dict((k, v) for k, v in resp.headers.items()
+                                  if k.lower() not in self.SKIP_HEADERS),
+                     body=base64.b64encode(resp.content).decode('ascii'),
+                     latency=time.time() - start)
+        with self.lock:
+            self.entries.append(entry)
+        return resp
+
+    def save(self):
+        if self not in FixtureAdapter.recording:
+            return
+        FixtureAdapter.recording.remove(self)
+        with self.lock:
+            write_state(self.filename, self.entries)
+
+    @classmethod
+    def save_all(cls):
+        """
+        Save the recording adapters, for processes ending with os._exit()
+        which skips the atexit handlers.
+        """
+        for adapter in list(cls.recording):
+            adapter.save()
+
+    def _replay(self, request, timeout):
+        with self.lock:
+            entries = self.responses.get(self.key(request.method, request.url))
+            if not entries:
+                raise requests_exceptions.ConnectionError(
+                    'no fixture for %s %s' % (request.method, request.url),
+                    request=request)
+            entry = entries.pop(0) if len(entries) > 1 else entries[0]
+
+        delay = self.latency
+        if delay == 'recorded':
+            delay = entry.get('latency', 0)
+        if isinstance(timeout, tuple):
+            timeout = timeout[1]
+        if delay and timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise requests_exceptions.ReadTimeout(
+                'replayed response of %s %s took longer than %ss'
+                % (request.method, request.url, timeout), request=request)
+        if delay:
+            time.sleep(delay)
+
+        resp = requests_models.Response()
+        resp.status_code = entry['status']
+        resp.reason = entry['reason']
+        resp.headers = CaseInsensitiveDict(entry['headers'])
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp._content = base64.b64decode(entry['body'])
+        resp.url = request.url
+        resp.request = request
+        resp.connection = self
+        return resp
+
+
+def makedirs(directory):
+    """
+    Create directory and its parents unless it exists, also when a
+    concurrent check creates it meanwhile.
+    """
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not path.isdir(directory):
+            raise
+
+
+def write_state(filename, data):
+    """
+    Atomically write json serializable data to filename, creating the
+    parent directory if needed.
+    """
+    directory = path.dirname(filename)
+    makedirs(directory)
+    fd, tmpname = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.rename(tmpname, filename)
+
+
+class Session(ksa_session.Session):
+    """
+    keystoneauth session shared by all clients of a check.
+
+    Every request (including authentication) gets at most the remaining
+    time of the deadline as timeout. If a response cache is given, GET
+    requests are sent as conditional requests and answered from the cache
+    on 304 Not Modified. The traffic of all requests is accounted if
+    traffic_perfdata (reported as perfdata) or traffic_log is set. A fixture adapter
+    records or replays the HTTP traffic.
+    """
+    def __init__(self, response_cache=None, deadline=None, hedging=None,
+                 traffic_perfdata=False, traffic_log=False, fixtures=None,
+                 rate_limiter=None, circuit_breaker=None, **kwargs):
+        ksa_session.Session.__init__(self, **kwargs)
+        if fixtures is not None:
+            self.session.mount('http://', fixtures)
+            self.session.mount('https://', fixtures)
+        self.response_cache = response_cache
+        self.deadline = deadline or Deadline(None)
+        self.hedging = hedging
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.traffic = TrafficStats(enabled=traffic_perfdata or traffic_log)
+        self.traffic_perfdata = traffic_perfdata
+
+    def request(self, url, method, **kwargs):
+        resp = self._request(url, method, **kwargs)
+        self.traffic.record(method, resp.url or url, resp)
+        return resp
+
+    def _request(self, url, method, **kwargs):
+        if self.deadline.expired():
+            raise DeadlineExceeded('time budget exhausted before %s %s'
+                                   % (method, url))
+
+        endpoint = None
+        probe = False
+        if self.circuit_breaker is not None:
+            endpoint = self.endpoint(url, kwargs)
+            probe = self.circuit_breaker.before(endpoint,
+                                                self.deadline.remaining())
+
+        cache = self.response_cache
+        key = entry = None
+        if cache is not None and method.upper() == 'GET':
+            key = cache.key(url, kwargs.get('endpoint_filter'),
+                            kwargs.get('params'), self.base_url(url, kwargs),
+                            self.identity(kwargs))
+            entry = cache.load(key)
+
+        host = None
+        if self.rate_limiter is not None:
+            service = self.service(url, kwargs)
+            host = self.host(url, kwargs)
+            if not self.rate_limiter.acquire(service, host, self.deadline):
+                if entry:
+                    _log.info('rate limit of %s exceeded, serving cached %s %s',
+                              service, method, url)
+                    return cache.response(entry, url)
+                raise RateLimitExceeded('request rate limit of %s exceeded'
+                                        % service)
+
+        remaining = self.deadline.remaining()
+        if remaining is not None:
+            timeout = kwargs.get('timeout') or self.timeout
+            kwargs['timeout'] = min(timeout or remaining, remaining)
+
+        if entry:
+            headers = dict(kwargs.get('headers') or {})
+            headers.update(cache.conditional_headers(entry))
+            kwargs['headers'] = headers
+        resp = self._send_checked(endpoint, probe, host, url, method, **kwargs)
+        if key is None:
+            return resp
+        return cache.update(key, entry, resp)
+
+    def _send_checked(self, endpoint, probe, host, url, method, **kwargs):
+        """
+        _send, recording the outcome in the circuit breaker. Failures after
+        the time budget ran out are not blamed on the endpoint.
+        """
+        if endpoint is None:
+            return self._send(host, url, method, **kwargs)
+        breaker = self.circuit_breaker
+        try:
+            resp = self._send(host, url, method, **kwargs)
+        except (ksa_exceptions.ConnectionError,
+                ksa_exceptions.HttpServerError) as e:
+            if probe or not self.deadline.expired():
+                breaker.failure(endpoint, str(e), probe)
+            raise
+        except ksa_exceptions.HttpError:
+            breaker.success(endpoint)
+            raise
+        if resp.status_code >= 500:
+            breaker.failure(endpoint, '%d %s' % (resp.status_code, resp.reason),
+                            probe)
+        else:
+            breaker.success(endpoint)
+        return resp
+
+    def _send(self, host, url, method, **kwargs):
+        if self.hedging is None or method.upper() != 'GET':
+            return ksa_session.Session.request(self, url, method, **kwargs)
+
+        service = self.service(url, kwargs)
+
+        # authenticate before racing two requests for the same token
+        if kwargs.get('authenticated', True) is not False and self.auth:
+            self.get_auth_headers()
+
+        results = queue.Queue()
+
+        def send(hedged, kwargs):
+            start = time.time()
+            try:
+                resp = ksa_session.Session.request(self, url, method, **kwargs)
+                results.put((hedged, time.time() - start, resp, None))
+            except Exception:
+                results.put((hedged, time.time() - start, None, sys.exc_info()))
+
+        def start(hedged, kwargs):
+            t = threading.Thread(target=send, args=(hedged, kwargs))
+            t.daemon = True
+            t.start()
+
+        started = time.time()
+        start(False, kwargs)
+        delay = self.hedging.delay(service)
+        try:
+            result = results.get(timeout=delay) if delay is not None else results.get()
+        except queue.Empty:
+            hedge_kwargs = self._hedge_kwargs(kwargs)
+            if (hedge_kwargs is not None and self.rate_limiter is not None and
+                    not self.rate_limiter.try_acquire(service, host)):
+                # the duplicate counts against the rate limit as well
+                self.hedging.stats['hedge_rate_limited'] += 1
+                hedge_kwargs = None
+            if hedge_kwargs is not None:
+                self.hedging.stats['hedge_fired'] += 1
+                _log.info('no response from %s after %.2fs, sending hedged request %s %s',
+                          service, delay, method, url)
+                start(True, hedge_kwargs)
+            result = results.get()
+            if result[0]:
+                self.hedging.stats['hedge_won'] += 1
+
+        hedged, latency, resp, exc_info = result
+        if self.hedging.tracker is not None:
+            # the original request is left running in a daemon thread when
+            # the hedge wins, record how long it took at least
+            if hedged:
+                latency = time.time() - started
+            self.hedging.tracker.record(service, latency)
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return resp
+
+    def endpoint(self, url, kwargs):
+        """
+        Endpoint of a request for the circuit breaker: the host and port it
+        goes to, resolved from the service catalog, or its service type and
+        region if it cannot be resolved.
+        """
+        host = self.host(url, kwargs)
+        if host:
+            return host
+        region = (kwargs.get('endpoint_filter') or {}).get('region_name')
+        service = self.service(url, kwargs)
+        if region:
+            return service + '@' + region
+        return service
+
+    def _hedge_kwargs(self, kwargs):
+        """
+        Arguments of a hedged duplicate of a request, with the timeout
+        limited to the remaining time budget, or None if the duplicate
+        may not be sent.
+        """
+        kwargs = dict(kwargs)
+        remaining = self.deadline.remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                return None
+            kwargs['timeout'] = min(kwargs.get('timeout') or remaining, remaining)
+        return kwargs
+
+    def base_url(self, url, kwargs):
+        """
+        Endpoint a request goes to: scheme and host of an absolute URL,
+        else its endpoint_override or the endpoint of its endpoint_filter
+        in the service catalog, None if there is none.
+        """
+        parts = urlsplit(url)
+        if parts.netloc:
+            return '%s://%s' % (parts.scheme, parts.netloc)
+        if kwargs.get('endpoint_override'):
+            return kwargs['endpoint_override']
+        if kwargs.get('endpoint_filter'):
+            return self.get_endpoint(kwargs.get('auth'),
+                                     allow=kwargs.get('allow') or {},
+                                     **kwargs['endpoint_filter'])
+        return None
+
+    def host(self, url, kwargs):
+        """
+        Host and port a request goes to, None if unknown.
+        """
+        base_url = self.base_url(url, kwargs)
+        return base_url and urlsplit(base_url).netloc or None
+
+    def identity(self, kwargs):
+        """
+        User and project ID a request is sent as, None if it is not
+        authenticated (e.g. during authentication).
+        """
+        auth = kwargs.get('auth') or self.auth
+        if kwargs.get('authenticated') is False or auth is None:
+            return None
+        return [self.get_user_id(auth), self.get_project_id(auth)]
+
+    def service(self, url, kwargs):
+        """
+        Service type of a request, or the host of an absolute URL (e.g.
+        of keystone during authentication).
+        """
+        service = (kwargs.get('endpoint_filter') or {}).get('service_type')
+        if not service and '://' in url:
+            service = url.split('/')[2]
+        return service or 'unknown'
+
+    def metrics(self):
+        """
+        Metrics describing the traffic of this session.
+        """
+        stats = {}
+        if self.response_cache is not None:
+            stats.update(self.response_cache.stats)
+        if self.hedging is not None:
+            stats.update(self.hedging.stats)
+        if self.rate_limiter is not None:
+            stats.update(self.rate_limiter.stats)
+        for name, value in sorted(stats.items()):
+            yield Metric(name, value, min=0, context='default')
+        if self.traffic_perfdata:
+            for m in self.traffic.metrics():
+                yield m
+
+
+class SessionLoader(loading.session.Session):
+    """
+    Loads our Session class instead of the plain keystoneauth one.
+    """
+    @property
+    def plugin_class(self):
+        return Session
+
+class Target(object):
+    """
+    A cloud and/or region a resource is probed in when a check runs against
+    several of them, with the session to use.
+    """
+    def __init__(self, label, session, auth_plugin, region_name, interface):
+        self.label = label
+        self.session = session
+        self.auth_plugin = auth_plugin
+        self.region_name = region_name
+        self.interface = interface
+
+
+def load_cloud(name):
+    """
+    Auth plugin, session options, region and interface of a cloud from
+    clouds.yaml.
+    """
+    import os_client_config
+    cloud = os_client_config.OpenStackConfig().get_one_cloud(name)
+    verify, cert = cloud.get_requests_verify_args()
+    return (cloud.get_auth(), dict(verify=verify, cert=cert),
+            cloud.config.get('region_name'), cloud.config.get('interface'))
+
+
+def next_link(body, key):
+    """
+    URL of the next page of a list response: the rel=next link of
+    KEY_links (neutron, nova, cinder) or the next attribute (ironic,
+    glance), None on the last page.
+    """
+    for link in body.get(key + '_links') or []:
+        if link.get('rel') == 'next':
+            return link['href']
+    return body.get('next')
+
+
+def paginate(session, url, key, page_size=DEFAULT_PAGE_SIZE, params=None,
+             on_response=None, **kwargs):
+    """
+    Yield the items of the list API at url one page at a time, so only a
+    single page of page_size items is held in memory.
+
+    Follows next links, and the limit/marker convention with the id of the
+    last item when a full page comes without link from a service which sent
+    no links before. on_response is called with the response of every page
+    (e.g. for its headers), kwargs are passed to session.get (e.g.
+    endpoint_filter).
+    """
+    params = dict(params or {}, limit=page_size)
+    first = None
+    while url:
+        resp = session.get(url, params=params, **kwargs)
+        if on_response:
+            on_response(resp)
+        body = resp.json()
+        items = body[key]
+        if not items:
+            return
+        if first is not None and items[0].get('id') == first:
+            # the server ignored the marker and sent the same page again
+            return
+        first = items[0].get('id')
+        for item in items:
+            yield item
+        link = next_link(body, key)
+        if link:
+            url, params = link, None
+        elif params is None:
+            # the previous page came with a link, this one is the last
+            return
+        elif len(items) >= page_size and 'id' in items[-1]:
+            params = dict(params or {}, limit=page_size, marker=items[-1]['id'])
+        else:
+            return
+
 
 class Resource(NagiosResource):
     """
     Base definition of OpenStack Nagios resource
     """
+    # set on the per target copies of a resource probed by Check, a class
+    # attribute as subclasses call exit_error() before this __init__ ran
+    target = None
+
     def __init__(self, args=None):
         NagiosResource.__init__(self)
-        self.auth_plugin = loading.cli.load_from_argparse_arguments(args)
-        self.session = loading.session.load_from_argparse_arguments(args, auth=self.auth_plugin)
+        response_cache = None
+        if args.http_cache:
+            response_cache = ResponseCache(args.cache_dir)
+        hedging = None
+        if args.hedge_after:
+            hedging = HedgingPolicy(args.hedge_after, args.hedge_max,
+                                    LatencyTracker(args.cache_dir))
+        rate_limiter = None
+        if args.rate_limit:
+            rate_limiter = RateLimiter(args.cache_dir, dict(args.rate_limit),
+                                       args.rate_limit_wait)
+        circuit_breaker = None
+        if args.circuit_breaker:
+            circuit_breaker = CircuitBreaker(args.cache_dir,
+                                             args.circuit_breaker,
+                                             args.circuit_reset)
+        fixtures = None
+        if args.record:
+            fixtures = FixtureAdapter(args.record)
+        elif args.replay:
+            latency = args.replay_latency
+            if latency != 'recorded':
+                latency = float(latency)
+            fixtures = FixtureAdapter(args.replay, replay=True, latency=latency)
+        session_options = dict(response_cache=response_cache,
+                               deadline=Deadline(args.timeout),
+                               hedging=hedging,
+                               traffic_perfdata=args.traffic_perfdata,
+                               traffic_log=args.verbose >= 2,
+                               fixtures=fixtures,
+                               rate_limiter=rate_limiter,
+                               circuit_breaker=circuit_breaker)
+
         self.api_version = args.os_api_version
+        self.passive = PassiveSubmitter.from_args(args)
         self.interface = args.os_interface
         self.region_name = args.os_region_name
+        self.page_size = args.page_size
+
+        regions = [None]
+        if args.os_region_name:
+            regions = [r.strip() for r in args.os_region_name.split(',')]
+
+        clouds = []
+        if args.os_cloud:
+            for cloud in args.os_cloud.split(','):
+                auth, options, region, interface = load_cloud(cloud.strip())
+                options.update(session_options)
+                session = Session(auth=auth, timeout=args.timeout, **options)
+                clouds.append((cloud.strip(), session, auth, region,
+                               interface or args.os_interface))
+            _, self.session, self.auth_plugin, self.region_name, self.interface = clouds[0]
+            self.region_name = regions[0] or self.region_name
+        else:
+            self.auth_plugin = loading.cli.load_from_argparse_arguments(args)
+            self.session = SessionLoader().load_from_argparse_arguments(
+                args, auth=self.auth_plugin, **session_options)
+
+        self.targets = []
+        if len(clouds) > 1 or len(regions) > 1:
+            for cloud in clouds or [(None, self.session, self.auth_plugin,
+                                     self.region_name, self.interface)]:
+                name, session, auth, cloud_region, interface = cloud
+                for region in regions:
+                    label = '/'.join(l for l in (name, region) if l)
+                    self.targets.append(Target(label, session, auth,
+                                               region or cloud_region,
+                                               interface))
 
     def exit_error(self, text):
+       if self.target:
+           raise CheckError(self.target.label + ': ' + text)
        print 'UNKNOWN - ' + text
        sys.exit(3)
 
+    def probe_targets(self):
+        """
+        Probe every target (cloud and/or region) concurrently with a copy
+        of this resource. Returns a list of (target, metrics, error) tuples,
+        metric names are prefixed with the target label.
+        """
+        results = dict()
+        locks = dict((id(t.session), threading.Lock()) for t in self.targets)
+
+        def probe(target):
+            resource = copy.copy(self)
+            resource.target = target
+            resource.session = target.session
+            resource.auth_plugin = target.auth_plugin
+            resource.region_name = target.region_name
+            resource.interface = target.interface
+            try:
+                if target.auth_plugin:
+                    # authenticate once per session, not once per region
+                    with locks[id(target.session)]:
+                        target.session.get_auth_headers()
+                metrics = [m.replace(name=target.label + ':' + m.name)
+                           for m in resource.probe()]
+                results[target.label] = (target, metrics, None)
+            except Exception as e:
+                results[target.label] = (target, [], e)
+
+        threads = [threading.Thread(target=probe, args=(t,))
+                   for t in self.targets]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            # join with timeout, so the nagiosplugin timeout can interrupt
+            while t.is_alive():
+                t.join(0.1)
+        return [results[t.label] for t in self.targets]
+
+    def session_metrics(self):
+        """
+        Additional metrics reported by the session (see Check), prefixed
+        with the cloud if the check ran against several clouds.
+        """
+        sessions = []
+        for target in self.targets:
+            if target.session not in [s for _, s in sessions]:
+                sessions.append((target.label.split('/')[0], target.session))
+        if len(sessions) <= 1:
+            return self.session.metrics()
+        return [m.replace(name=label + ':' + m.name)
+                for label, session in sessions for m in session.metrics()]
+
+    def paginate(self, service_type, path, key, **params):
+        """
+        Lazily yield the items of a list API of service_type (see paginate),
+        in the region and interface of this resource.
+        """
+        return paginate(self.session, path, key, page_size=self.page_size,
+                        params=params,
+                        endpoint_filter=self.endpoint_filter(service_type))
+
+    def endpoint_filter(self, service_type):
+        """
+        Endpoint filter for requests to service_type on the session, in
+        the region and interface of this resource.
+        """
+        return dict(service_type=service_type, interface=self.interface,
+                    region_name=self.region_name)
+
+    def out_of_time(self, error):
+        """
+        True if error was caused by the time budget running out. Checks
+        iterating over several requests use this to stop and report the
+        partial result with an incomplete metric instead of failing.
+        """
+        return (isinstance(error, DeadlineExceeded) or
+                self.session.deadline.expired())
+
+    def incomplete(self, skipped):
+        """
+        Metric marking a result as incomplete, skipped is the number of
+        items which could not be checked anymore.
+        """
+        return Metric('incomplete', skipped, min=0, context='incomplete')
+
+
+class IncompleteContext(Context):
+    """
+    Warns about an incomplete result (see Resource.incomplete).
+    """
+    def __init__(self, name='incomplete'):
+        Context.__init__(self, name)
+
+    def evaluate(self, metric, resource):
+        if metric.value:
+            return self.result_cls(
+                Warn, 'incomplete, {0} not checked (time budget exhausted)'.format(
+                    metric.value), metric)
+        return self.result_cls(Ok, None, metric)
+
+
+class ProbedMetrics(NagiosResource):
+    """
+    Metrics of a Resource which were probed already (session metrics,
+    region results), to be evaluated like a resource on its own.
+    """
+    def __init__(self, resource, metrics):
+        self.resource = resource
+        self.metrics = metrics
+
+    @property
+    def name(self):
+        return self.resource.name
+
+    def probe(self):
+        return self.metrics
+
+
+class Check(NagiosCheck):
+    """
+    Check which also evaluates the session metrics of its resources after
+    the resource has been probed, and knows the incomplete context.
+
+    Resources with several targets (clouds and/or regions) are probed
+    concurrently in all of them, the overall state is the worst state of
+    all targets.
+    """
+    def __init__(self, *objects, **kwargs):
+        NagiosCheck.__init__(self, *objects, **kwargs)
+        if 'incomplete' not in self.contexts:
+            self.contexts.add(IncompleteContext())
+
+    def main(self, verbose=None, timeout=None):
+        for resource in self.resources:
+            passive = getattr(resource, 'passive', None)
+            if passive is not None:
+                return passive.run(self, verbose, timeout)
+        return NagiosCheck.main(self, verbose, timeout)
+
+    def _evaluate_resource(self, resource):
+        if isinstance(resource, Resource) and resource.targets:
+            for target, metrics, error in resource.probe_targets():
+                if error is not None:
+                    self.results.add(Result(Unknown, str(error)))
+                if metrics:
+                    NagiosCheck._evaluate_resource(
+                        self, ProbedMetrics(resource, metrics))
+        else:
+            NagiosCheck._evaluate_resource(self, resource)
+
+        if isinstance(resource, Resource):
+            metrics = list(resource.session_metrics())
+            if metrics:
+                NagiosCheck._evaluate_resource(
+                    self, ProbedMetrics(resource, metrics))
+
 
 class Summary(NagiosSummary):
     """
@@ -61,18 +1276,141 @@ class Summary(NagiosSummary):
         super(NagiosSummary, self).__init__()
 
     def ok(self, results):
-        return '[' + ' '.join(
-            r + ':' + str(results[r].metric) for r in self.show) + ']'
+        return '[' + ' '.join(self._show(results)) + ']'
 
     def problem(self, results):
         return str(results.first_significant) + '[' + ' '.join(
-            r + ':' + str(results[r].metric) for r in self.show) + ']'
+            self._show(results)) + ']'
+
+    def _show(self, results):
+        for r in self.show:
+            if r in results:
+                yield r + ':' + str(results[r].metric)
+                continue
+            # target:name metrics of a check run against several clouds/regions
+            metrics = sorted((result.metric for result in results
+                              if result.metric and
+                              result.metric.name.endswith(':' + r)),
+                             key=lambda m: m.name)
+            for metric in metrics:
+                yield metric.name + ':' + str(metric)
+
+
+def timestamp_age(timestamp, now):
+    """
+    Age in seconds of an OpenStack API timestamp in UTC like
+    'YYYY-MM-DD HH:MM:SS' or 'YYYY-MM-DDTHH:MM:SS.ffffff'. Slicing the fixed
+    format is much cheaper than strptime when done for every item of a list.
+    """
+    t = (int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+         int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))
+    return now - calendar.timegm(t)
+
+
+class Profiler(object):
+    """
+    Profiles the rest of the check run with cProfile and writes, when the
+    process exits, the pstats file and a collapsed stack file (one
+    'frame;frame;frame microseconds' line per stack) for flame graphs.
+
+    The collapsed stacks are derived from the caller/callee times of
+    cProfile, so time of functions called from several places is split
+    proportionally between their callers.
+    """
+    MAX_DEPTH = 64
+
+    # started and not yet stopped profilers
+    running = []
+
+    def __init__(self, filename):
+        if path.isdir(filename):
+            filename = path.join(filename, '%s-%d-%d.pstats' % (
+                path.basename(sys.argv[0]), time.time(), os.getpid()))
+        self.filename = filename
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        atexit.register(self.stop)
+        Profiler.running.append(self)
+        self.profile.enable()
+
+    def stop(self):
+        if self not in Profiler.running:
+            return
+        Profiler.running.remove(self)
+        self.profile.disable()
+        self.profile.dump_stats(self.filename)
+        with open(self.filename + '.collapsed', 'w') as f:
+            self.write_collapsed(pstats.Stats(self.filename), f)
+
+    def write_collapsed(self, stats, out):
+        callees = {}
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+            for caller, edge in callers.items():
+                # edge is (cc, nc, tt, ct) or just a call count
+                edge_ct = edge[3] if isinstance(edge, tuple) else 0
+                callees.setdefault(caller, []).append((func, edge_ct))
+
+        def label(func):
+            filename, line, name = func
+            return '%s:%d:%s' % (path.basename(filename), line, name)
+
+        def walk(func, weight, stack):
+            tt, ct = stats.stats[func][2:4]
+            stack = stack + [label(func)]
+            usec = int(weight * tt / ct * 1000000) if ct > 0 else 0
+            if usec > 0:
+                out.write('%s %d\n' % (';'.join(stack), usec))
+            if len(stack) >= self.MAX_DEPTH or ct <= 0:
+                return
+            for callee, edge_ct in callees.get(func, []):
+                if label(callee) not in stack and edge_ct > 0:
+                    walk(callee, weight * edge_ct / ct, stack)
+
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+            if not callers:
+                walk(func, ct, [])
+
+    @classmethod
+    def stop_all(cls):
+        """
+        Stop the running profilers, for processes ending with os._exit()
+        which skips the atexit handlers.
+        """
+        for profiler in list(cls.running):
+            profiler.stop()
+
+    @classmethod
+    def from_argv(cls, argv):
+        """
+        Profiler for --profile PATH, or for 1 in env[OS_NAGIOS_PROFILE_SAMPLE]
+        runs (into the directory env[OS_NAGIOS_PROFILE_DIR]), else None.
+        """
+        pre = ArgArgumentParser(add_help=False)
+        pre.add_argument('--profile')
+        known, _ = pre.parse_known_args(argv)
+        if known.profile:
+            return cls(known.profile)
+
+        sample = int(getenv('OS_NAGIOS_PROFILE_SAMPLE', '0') or 0)
+        if sample > 0 and random.randrange(sample) == 0:
+            directory = getenv('OS_NAGIOS_PROFILE_DIR', path.join(
+                getenv('OS_NAGIOS_CACHE_DIR', DEFAULT_CACHE_DIR), 'profiles'))
+            makedirs(directory)
+            return cls(directory)
+        return None
 
 
 class ArgumentParser(ArgArgumentParser):
     def __init__(self, description, epilog=''):
         ArgArgumentParser.__init__(self, description=description, epilog=epilog)
         argv = sys.argv[1:]
+
+        # start as early as possible to include argument parsing
+        profiler = Profiler.from_argv(argv)
+        if profiler:
+            profiler.start()
+
         loading.cli.register_argparse_arguments(self, argv, DEFAULT_AUTH_TYPE)
         loading.session.register_argparse_arguments(self)
 
@@ -88,11 +1426,137 @@ class ArgumentParser(ArgArgumentParser):
                           default=getenv('OS_API_VERSION', DEFAULT_API_VERSION),
                           help='Minimum Major API version within a given '
                                'Major API version for client selection and '
-                               'endpoint URL discovery.')
+                               'endpoint URL discovery. Ignored by checks '
+                               'paging through the REST API (see --page-size).')
         self.add_argument('--os-interface', default=getenv('OS_INTERFACE'))
         self.add_argument('--os-region-name', default=getenv('OS_REGION_NAME'),
                           help='The default region_name for endpoint URL '
-                               'discovery.')
+                               'discovery. A comma separated list of regions '
+                               'checks all of them concurrently and reports '
+                               'REGION:METRIC results.')
+
+        self.add_argument('--os-cloud', default=getenv('OS_CLOUD'),
+                          help='cloud from clouds.yaml to check instead of the '
+                               'auth arguments. A comma separated list checks '
+                               'all of them concurrently, each with its own '
+                               'session, and reports CLOUD:METRIC results.')
+
+        self.add_argument('--cache-dir',
+                          default=getenv('OS_NAGIOS_CACHE_DIR', DEFAULT_CACHE_DIR),
+                          help='directory for data kept between check runs '
+                               '(default: env[OS_NAGIOS_CACHE_DIR] or '
+                               '~/.cache/openstacknagios)')
+        self.add_argument('--http-cache', action='store_true', default=False,
+                          help='cache GET responses and revalidate them with '
+                               'conditional requests (ETag/Last-Modified); '
+                               'reports cache_hits, cache_misses and '
+                               'cache_unsupported as perfdata')
+
+        self.add_argument('--hedge-after', metavar='SECONDS|auto', default=None,
+                          type=hedge_after_spec,
+                          help='send a duplicate of a GET request which did '
+                               'not answer within SECONDS and use the first '
+                               'response; auto uses the p95 latency of the '
+                               'service learned from previous runs. Reports '
+                               'hedge_fired, hedge_won and hedge_rate_limited '
+                               '(not sent because of --rate-limit) as '
+                               'perfdata')
+        self.add_argument('--hedge-max', metavar='N', type=int, default=2,
+                          help='maximum number of hedged requests per check '
+                               'run (default: 2)')
+
+        self.add_argument('--rate-limit', metavar='[SERVICE=]RATE',
+                          type=rate_limit_spec, action='append', default=None,
+                          help='limit the requests of all checks to a service '
+                               'type (e.g. network, or the host of keystone) '
+                               'to RATE per second and endpoint, without '
+                               'SERVICE for all other services. Can be '
+                               'repeated. Checks exceeding it wait, serve '
+                               '--http-cache data or fail, hedged requests '
+                               'are not sent. Reports rate_limit_waits, '
+                               'rate_limit_wait_time and rate_limit_exceeded '
+                               'as perfdata')
+        self.add_argument('--rate-limit-wait', metavar='SECONDS', type=float,
+                          default=2,
+                          help='maximum time to wait for the rate limit '
+                               '(default: 2)')
+
+        self.add_argument('--circuit-breaker', metavar='N', type=int,
+                          default=0,
+                          help='after N consecutive failures (connection '
+                               'errors, timeouts, 5xx) of an endpoint, fail '
+                               'the requests of all checks to it immediately '
+                               'with the last failure (default: 0, disabled)')
+        self.add_argument('--circuit-reset', metavar='SECONDS', type=float,
+                          default=60,
+                          help='let a single request through to an endpoint '
+                               'which failed after SECONDS, its success '
+                               'resumes all requests (default: 60)')
+
+        self.add_argument('--traffic-perfdata', action='store_true',
+                          default=False,
+                          help='report the number of requests, response bytes '
+                               'on the wire and decompressed, json objects and '
+                               'json decode time as perfdata (with -vv they '
+                               'are listed per request). Bodies decoded by a '
+                               'client library itself count as 0 objects')
+
+        self.add_argument('--profile', metavar='PATH', default=None,
+                          help='profile the check run and write pstats to PATH '
+                               'and collapsed stacks (for flame graphs) to '
+                               'PATH.collapsed. If PATH is a directory, a file '
+                               'per run is created in it. Set '
+                               'env[OS_NAGIOS_PROFILE_SAMPLE]=N to profile 1 '
+                               'in N runs into env[OS_NAGIOS_PROFILE_DIR]')
+
+        self.add_argument('--record', metavar='FILE', default=None,
+                          help='record the HTTP requests and responses of '
+                               'the check run into the fixture FILE (it '
+                               'contains the tokens of the run)')
+        self.add_argument('--replay', metavar='FILE', default=None,
+                          help='replay the responses of the fixture FILE '
+                               'recorded with --record instead of sending '
+                               'requests to the cloud')
+        self.add_argument('--replay-latency', metavar='SECONDS|recorded',
+                          default='0',
+                          help='delay of every replayed response, recorded '
+                               'uses the latencies seen while recording '
+                               '(default: 0)')
+
+        self.add_argument('--page-size', metavar='N', type=int,
+                          default=DEFAULT_PAGE_SIZE,
+                          help='number of items requested per page by checks '
+                               'counting large lists, they are processed page '
+                               'by page (default: %d). These checks '
+                               '(neutron-agents, -floatingips, -routers, '
+                               'nova-servers, ironic-consoles) request the '
+                               'REST API without client library and ignore '
+                               '--os-api-version' % DEFAULT_PAGE_SIZE)
+
+        self.add_argument('--command-file', default=None,
+                          help='submit the result as passive check result '
+                               'into this Nagios/Icinga external command file '
+                               'instead of printing it')
+        self.add_argument('--spool-dir', default=None,
+                          help='submit the result as passive check result '
+                               'file into this check result directory '
+                               '(check_result_path) instead of printing it')
+        self.add_argument('--passive-host', default=None,
+                          help='host name of passive results')
+        self.add_argument('--passive-service', default=None,
+                          help='service description of passive results '
+                               '(default: name of the check)')
+        self.add_argument('--passive-per-metric', action='store_true',
+                          default=False,
+                          help='also submit the result of every metric as '
+                               'service "SERVICE METRIC" (e.g. with the per '
+                               'host modes of the service checks)')
 
         self.add_argument('-v', '--verbose', action='count', default=0,
                           help='increase output verbosity (use up to 3 times)')
+
+    def parse_args(self, args=None, namespace=None):
+        args = ArgArgumentParser.parse_args(self, args, namespace)
+        if (args.command_file or args.spool_dir) and not args.passive_host:
+            self.error('--passive-host is required with --command-file or --spool-dir')
+        return args
@@ -0,0 +1,296 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+  Submits check results as passive results to Nagios/Icinga.
+
+  Reads a batch file with one check per line:
+
+    HOST;SERVICE;CHECK [ARGUMENTS]
+
+  e.g. 'ctl1;nova-compute services;check_nova-services --binary nova-compute',
+  runs the checks and writes all results with as few writes as possible into
+  the external command file or the check result spool directory.
+"""
+
+from __future__ import absolute_import
+
+import argparse
+import errno
+import fcntl
+import os
+import random
+import select
+import shlex
+import string
+import sys
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from openstacknagios import runner
+
+# writes to a pipe up to this size are atomic
+PIPE_BUF = getattr(select, 'PIPE_BUF', 512)
+
+
+def escape(output):
+    """
+    Nagios expects the plugin output on a single line with '\\n' escapes.
+    """
+    return output.strip().replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def to_text(value):
+    """
+    value as text, decoding UTF-8 bytes (e.g. the captured output of a
+    check or the batch file on python 2).
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def write_all(fd, data):
+    """
+    os.write all of data, which may take several writes if it is larger
+    than PIPE_BUF.
+    """
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def command_line(host, service, code, output, timestamp=None):
+    return u'[%d] PROCESS_SERVICE_CHECK_RESULT;%s;%s;%d;%s\n' % (
+        timestamp or time.time(), to_text(host), to_text(service), code,
+        escape(to_text(output)))
+
+
+class CommandFileWriter(object):
+    """
+    Writes results into the external command file (named pipe) of
+    Nagios/Icinga. Lines are grouped into writes of at most PIPE_BUF bytes
+    so that no line is interleaved with the writes of other processes (but
+    a single line longer than PIPE_BUF may be).
+    """
+    def __init__(self, filename):
+        self.filename = filename
+
+    def write(self, results):
+        # O_NONBLOCK makes open fail instead of hang if Nagios is not reading
+        fd = os.open(self.filename, os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+            chunk = b''
+            for result in results:
+                line = command_line(*result).encode('utf-8')
+                if chunk and len(chunk) + len(line) > PIPE_BUF:
+                    write_all(fd, chunk)
+                    chunk = b''
+                chunk += line
+            if chunk:
+                write_all(fd, chunk)
+        finally:
+            os.close(fd)
+
+
+class SpoolDirWriter(object):
+    """
+    Writes results as one check result file into the check_result_path of
+    Nagios (or Icinga 1), which picks it up once the .ok file exists.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _create(self):
+        # Nagios only reads files named 'c' followed by 6 characters
+        chars = string.ascii_letters + string.digits
+        while True:
+            name = os.path.join(self.directory, 'c' + ''.join(
+                random.choice(chars) for _ in range(6)))
+            try:
+                return name, os.open(name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def write(self, results):
+        now = time.time()
+        lines = ['### Passive Check Result File ###',
+                 'file_time=%d' % now, '']
+        for host, service, code, output in results:
+            lines += ['### Nagios Service Check Result ###',
+                      '# Time: %s' % time.ctime(now),
+                      'host_name=%s' % to_text(host),
+                      'service_description=%s' % to_text(service),
+                      'check_type=1',
+                      'check_options=0',
+                      'scheduled_check=0',
+                      'reschedule_check=0',
+                      'latency=0.0',
+                      'start_time=%f' % now,
+                      'finish_time=%f' % now,
+                      'early_timeout=0',
+                      'exited_ok=1',
+                      'return_code=%d' % code,
+                      'output=%s' % escape(to_text(output)),
+                      '']
+        name, fd = self._create()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(u'\n'.join(lines).encode('utf-8'))
+        open(name + '.ok', 'w').close()
+
+
+def writer_from_args(args):
+    if args.command_file:
+        return CommandFileWriter(args.command_file)
+    if args.spool_dir:
+        return SpoolDirWriter(args.spool_dir)
+    return None
+
+
+class PassiveSubmitter(object):
+    """
+    Runs a check and submits its result (and with per_metric the result of
+    every metric as its own service) instead of printing it.
+    """
+    def __init__(self, writer, host, service, per_metric=False):
+        self.writer = writer
+        self.host = host
+        self.service = service
+        self.per_metric = per_metric
+
+    @classmethod
+    def from_args(cls, args):
+        writer = writer_from_args(args)
+        if writer is None:
+            return None
+        service = args.passive_service or os.path.basename(sys.argv[0])
+        return cls(writer, args.passive_host, service, args.passive_per_metric)
+
+    def run(self, check, verbose=None, timeout=None):
+        from nagiosplugin.runtime import Runtime
+
+        runtime = Runtime()
+        out = StringIO()
+        stdout, sys.stdout = sys.stdout, out
+        code = 3
+        try:
+            runtime.execute(check, verbose, timeout)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 3
+        except Exception as e:
+            out.write('UNKNOWN - %s' % e)
+        finally:
+            sys.stdout = stdout
+
+        results = [(self.host, self.service, code if 0 <= code <= 3 else 3,
+                    out.getvalue())]
+        if self.per_metric:
+            for result in check.results:
+                if result.metric is None:
+                    continue
+                output = '%s - %s' % (str(result.state).upper(), result)
+                perfdata = result.metric.performance()
+                if perfdata:
+                    output += ' | %s' % str(perfdata)
+                results.append((self.host,
+                                '%s %s' % (self.service, result.metric.name),
+                                result.state.code, output))
+
+        try:
+            self.writer.write(results)
+        except (IOError, OSError) as e:
+            print('UNKNOWN - cannot submit passive results: %s' % e)
+            sys.exit(3)
+        print('OK - submitted %d passive results' % len(results))
+        sys.exit(0)
+
+
+def read_batch(lines):
+    """
+    Parse batch file lines into (check, argv, (host, service)) jobs.
+    Malformed lines are reported on stderr and skipped.
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            host, service, command = line.split(';', 2)
+            argv = shlex.split(command)
+        except ValueError:
+            argv = None
+        if not argv or not host or not service:
+            sys.stderr.write('skipping line %d of batch file, expected '
+                             'HOST;SERVICE;CHECK [ARGUMENTS]: %s\n'
+                             % (number, line))
+            continue
+        yield argv[0], argv[1:], (host, service)
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('batch_file', nargs='?',
+                      help='file with the checks to run (default: stdin)')
+    argp.add_argument('--command-file', default=None,
+                      help='external command file of Nagios/Icinga')
+    argp.add_argument('--spool-dir', default=None,
+                      help='check result spool directory (check_result_path)')
+    argp.add_argument('--parallel', metavar='N', type=int, default=1,
+                      help='number of checks to run at the same time (default: 1)')
+    argp.add_argument('--per-service', metavar='N', type=int, default=0,
+                      help='number of checks of the same service (e.g. nova) to run '
+                           'at the same time (default: 0, only limited by --parallel)')
+    argp.add_argument('--spread', metavar='SECONDS', type=float, default=0,
+                      help='start the checks at evenly spaced offsets within SECONDS '
+                           'instead of all at once (default: 0)')
+    argp.add_argument('--jitter', metavar='FRACTION', type=float, default=0,
+                      help='shift the start of every check by a random fraction of '
+                           'up to FRACTION of --spread (default: 0)')
+    args = argp.parse_args()
+
+    writer = writer_from_args(args)
+    if writer is None:
+        argp.error('either --command-file or --spool-dir is required')
+
+    if args.batch_file:
+        with open(args.batch_file) as f:
+            jobs = list(read_batch(f))
+    else:
+        jobs = list(read_batch(sys.stdin))
+
+    results = []
+    for proc in runner.run_checks(jobs, parallel=args.parallel,
+                                  per_service=args.per_service,
+                                  spread=args.spread,
+                                  jitter=args.jitter):
+        host, service = proc.job
+        results.append((host, service, proc.code, proc.text()))
+
+    try:
+        writer.write(results)
+    except (IOError, OSError) as e:
+        print('UNKNOWN - cannot submit passive results: %s' % e)
+        sys.exit(3)
+    print('OK - submitted %d passive results' % len(results))
+
+if __name__ == '__main__':
+    main()
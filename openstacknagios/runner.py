@@ -0,0 +1,220 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+  Runs the checks of this package in forked child processes and collects
+  their exit code and output, for tools running many checks from one
+  process.
+"""
+
+from __future__ import absolute_import
+
+import importlib
+import os
+import random
+import select
+import sys
+import time
+import traceback
+
+# console script name -> module with the main() of the check
+CHECKS = {
+    'check_nova-images': 'openstacknagios.nova.Images',
+    'check_nova-services': 'openstacknagios.nova.Services',
+    'check_nova-hypervisors': 'openstacknagios.nova.Hypervisors',
+    'check_nova-servers': 'openstacknagios.nova.Servers',
+    'check_cinder-services': 'openstacknagios.cinder.Services',
+    'check_neutron-agents': 'openstacknagios.neutron.Agents',
+    'check_neutron-floatingips': 'openstacknagios.neutron.Floatingips',
+    'check_neutron-networkipavailabilities': 'openstacknagios.neutron.Networkipavailabilities',
+    'check_neutron-routers': 'openstacknagios.neutron.Routers',
+    'check_keystone-token': 'openstacknagios.keystone.Token',
+    'check_keystone-endpoints': 'openstacknagios.keystone.Endpoints',
+    'check_ceilometer-statistics': 'openstacknagios.ceilometer.Statistics',
+    'check_gnocchi-metrics': 'openstacknagios.gnocchi.Metrics',
+    'check_gnocchi-status': 'openstacknagios.gnocchi.Status',
+    'check_gnocchi-statistics': 'openstacknagios.gnocchi.Statistics',
+    'check_rally-results': 'openstacknagios.rally.Results',
+    'check_ironic-nodes': 'openstacknagios.ironic.Nodes',
+    'check_ironic-node-consoles': 'openstacknagios.ironic.Consoles',
+}
+
+
+def service(name):
+    """
+    OpenStack service (e.g. nova) queried by check name.
+    """
+    module = CHECKS.get(name, '')
+    return module.split('.')[1] if '.' in module else name
+
+
+def offsets(keys):
+    """
+    Fractions in [0, 1) for keys, used to spread the start of checks over
+    an interval: the i-th of the N sorted keys gets i/N, so the starts are
+    evenly spaced and do not depend on the order of the batch file.
+    """
+    fractions = [0.0] * len(keys)
+    order = sorted(range(len(keys)), key=lambda i: keys[i])
+    for rank, i in enumerate(order):
+        fractions[i] = rank / float(len(keys))
+    return fractions
+
+
+def run_main(name, argv):
+    """
+    Run the main() of check name with argv in this process and return its
+    exit code. Meant to be called in a freshly forked child.
+    """
+    import openstacknagios.openstacknagios as osnag
+    # the time budget of the check starts now, not when the parent started
+    osnag.START_TIME = time.time()
+
+    sys.argv = [name] + list(argv)
+    code = 3
+    try:
+        module = importlib.import_module(CHECKS[name])
+        module.main()
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code)
+    except KeyError:
+        print('UNKNOWN - no such check: %s' % name)
+    except Exception:
+        print('UNKNOWN - %s' % traceback.format_exc().splitlines()[-1])
+
+    # the caller ends with os._exit(), the atexit handlers do not run
+    try:
+        osnag.Profiler.stop_all()
+    except Exception:
+        sys.stderr.write('cannot write profile: %s\n'
+                         % traceback.format_exc().splitlines()[-1])
+    try:
+        osnag.FixtureAdapter.save_all()
+    except Exception:
+        sys.stderr.write('cannot write fixture: %s\n'
+                         % traceback.format_exc().splitlines()[-1])
+    return code
+
+
+class CheckProcess(object):
+    """
+    A check running in a forked child, its stdout is read through a pipe.
+    """
+    def __init__(self, name, argv, job=None):
+        self.name = name
+        self.argv = argv
+        self.job = job
+        self.service = service(name)
+        self.output = []
+        self.code = None
+        self.pid = None
+        self.fd = None
+
+    def start(self):
+        sys.stdout.flush()
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 3
+            try:
+                os.close(r)
+                os.dup2(w, 1)
+                code = run_main(self.name, self.argv)
+            finally:
+                try:
+                    sys.stdout.flush()
+                finally:
+                    os._exit(code if 0 <= code <= 3 else 3)
+        os.close(w)
+        self.pid = pid
+        self.fd = r
+        return self
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """
+        Read available output, returns False once the check finished.
+        """
+        data = os.read(self.fd, 65536)
+        if data:
+            self.output.append(data)
+            return True
+        os.close(self.fd)
+        _, status = os.waitpid(self.pid, 0)
+        if os.WIFEXITED(status):
+            self.code = os.WEXITSTATUS(status)
+        else:
+            self.code = 3
+            self.output.append(b'UNKNOWN - check killed by signal %d\n'
+                               % os.WTERMSIG(status))
+        return False
+
+    def wait(self):
+        while self.read():
+            pass
+        return self.code, self.text()
+
+    def text(self):
+        return b''.join(self.output).decode('utf-8', 'replace')
+
+
+def run_checks(jobs, parallel=1, per_service=0, spread=0, jitter=0):
+    """
+    Run (name, argv, job) tuples with at most parallel checks at once and
+    yield the finished CheckProcess objects in order of completion.
+
+    With per_service at most that many checks of the same service run at
+    once. With spread the checks start at evenly spaced offsets within
+    spread seconds instead of all at once, each shifted by a random
+    fraction of up to jitter of spread.
+    """
+    now = time.time()
+    fractions = offsets([' '.join([name] + list(argv))
+                         for name, argv, job in jobs])
+    pending = sorted((now + spread * (fraction + random.uniform(0, jitter)),
+                      i, name, argv, job)
+                     for i, ((name, argv, job), fraction)
+                     in enumerate(zip(jobs, fractions)))
+    running = []
+    while pending or running:
+        now = time.time()
+        timeout = None
+        for item in list(pending):
+            if len(running) >= parallel:
+                break
+            start, _, name, argv, job = item
+            if start > now:
+                timeout = start - now
+                break
+            if per_service and len([p for p in running if p.service == service(name)]) >= per_service:
+                continue
+            pending.remove(item)
+            running.append(CheckProcess(name, argv, job).start())
+        if not running:
+            time.sleep(timeout or 0)
+            continue
+        ready, _, _ = select.select(running, [], [], timeout)
+        for proc in ready:
+            if not proc.read():
+                running.remove(proc)
+                yield proc
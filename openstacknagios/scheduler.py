@@ -0,0 +1,325 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+  Runs the checks of a batch file (see openstacknagios-passive) over and
+  over and submits every result as passive result.
+
+  The interval of each check adapts to its perfdata: from the last two
+  runs the time until a metric reaches its warning or critical range is
+  estimated, and the check runs again after half of that time, within
+  --min-interval and --max-interval. Metrics close to a threshold shorten
+  the interval also without moving, down to --min-interval at the
+  threshold. Stable metrics far from their thresholds are polled rarely,
+  metrics moving towards or close to a threshold more often, and checks
+  not in OK state with --min-interval.
+
+  To avoid all checks hitting the APIs at the same time, the first runs are
+  spread evenly over --min-interval by host and service, every
+  interval gets a random --jitter and --per-service limits the number of
+  checks of the same service running at once.
+"""
+
+from __future__ import absolute_import
+
+import argparse
+import random
+import re
+import select
+import sys
+import time
+
+from nagiosplugin import Range
+
+from openstacknagios import runner
+from openstacknagios.passive import read_batch, writer_from_args
+
+# label=value[UOM];[warn];[crit];[min];[max], labels with spaces are quoted
+PERFDATA = re.compile(r"('(?:[^']|'')+'|[^\s=']+)=(\S+)")
+NUMBER = re.compile(r'^-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+
+# run again after this share of the estimated time to the next threshold
+SAFETY = 0.5
+
+# metrics closer to a threshold than this share of it shorten the interval
+NEAR = 0.25
+
+
+def parse_perfdata(output):
+    """
+    Perfdata of plugin output as list of (label, value, warn, critical),
+    warn and critical are range specifications or None.
+    """
+    lines = output.splitlines()
+    perfdata = []
+    if lines and '|' in lines[0]:
+        perfdata.append(lines[0].split('|', 1)[1])
+    for i, line in enumerate(lines[1:]):
+        if '|' in line:
+            perfdata.append(line.split('|', 1)[1])
+            perfdata.extend(lines[i + 2:])
+            break
+
+    result = []
+    for label, data in PERFDATA.findall(' '.join(perfdata)):
+        if label.startswith("'"):
+            label = label[1:-1].replace("''", "'")
+        fields = data.split(';')
+        value = NUMBER.match(fields[0])
+        if not value:
+            continue
+        fields += [''] * 3
+        result.append((label, float(value.group(0)),
+                       fields[1] or None, fields[2] or None))
+    return result
+
+
+def time_to_threshold(value, rate, spec):
+    """
+    Seconds until value changing by rate per second leaves the range spec
+    (i.e. reaches the threshold), None if it does not get closer.
+    """
+    try:
+        r = Range(spec)
+    except ValueError:
+        return None
+    if r.invert:
+        # alerts inside start:end
+        if r.start <= value <= r.end:
+            return 0
+        bounds = [(r.start, 1)] if value < r.start else [(r.end, -1)]
+    else:
+        if not r.start <= value <= r.end:
+            return 0
+        bounds = [(r.start, -1), (r.end, 1)]
+
+    times = []
+    for bound, direction in bounds:
+        if abs(bound) == float('inf') or rate * direction <= 0:
+            continue
+        times.append(abs(bound - value) / abs(rate))
+    return min(times) if times else None
+
+
+def threshold_distance(value, spec):
+    """
+    Distance of value to the nearest bound of the range spec (i.e. the
+    threshold) as share of that bound, 0 outside of the range, None if it
+    has no finite bound other than 0 (e.g. the 0 of 0:10000 is skipped).
+    """
+    try:
+        r = Range(spec)
+    except ValueError:
+        return None
+    if r.invert:
+        if r.start <= value <= r.end:
+            return 0
+        bounds = [r.start] if value < r.start else [r.end]
+    else:
+        if not r.start <= value <= r.end:
+            return 0
+        bounds = [r.start, r.end]
+
+    distances = [abs(bound - value) / float(abs(bound)) for bound in bounds
+                 if bound != 0 and abs(bound) != float('inf')]
+    return min(distances) if distances else None
+
+
+class Job(object):
+    """
+    A check of the batch file with its adaptive interval.
+    """
+    def __init__(self, check, argv, host, service, interval):
+        self.check = check
+        self.argv = argv
+        self.host = host
+        self.service = service
+        self.interval = interval
+        self.next_run = 0
+        self.running = False
+        self.values = {}
+
+    def schedule(self, code, output, now, min_interval, max_interval):
+        """
+        Adapt the interval to the result of a run finished at now.
+        """
+        estimates = []
+        distances = []
+        values = {}
+        for label, value, warn, critical in parse_perfdata(output):
+            values[label] = value
+            for spec in (warn, critical):
+                if spec:
+                    distance = threshold_distance(value, spec)
+                    if distance is not None:
+                        distances.append(distance)
+            if label not in self.values:
+                continue
+            last_value, last_time = self.values[label]
+            if now <= last_time:
+                continue
+            rate = (value - last_value) / (now - last_time)
+            for spec in (warn, critical):
+                if spec:
+                    estimate = time_to_threshold(value, rate, spec)
+                    if estimate is not None:
+                        estimates.append(estimate)
+        self.values = dict((label, (value, now))
+                           for label, value in values.items())
+
+        if code != 0:
+            interval = min_interval
+        elif estimates:
+            interval = min(estimates) * SAFETY
+        else:
+            # nothing approaches a threshold: lengthen gradually, so a
+            # metric starting to move is noticed within a few runs
+            interval = self.interval * 2
+        if distances and min(distances) < NEAR:
+            # also without movement, a small change may cross the threshold
+            interval = min(interval, min_interval + (max_interval - min_interval)
+                           * min(distances) / NEAR)
+        self.interval = max(min_interval, min(max_interval, interval))
+        self.next_run = now + self.interval
+
+
+class Scheduler(object):
+    """
+    Runs the jobs whenever they are due, at most parallel at once, and
+    submits their results with writer.
+    """
+    def __init__(self, jobs, writer, min_interval, max_interval, parallel=1,
+                 per_service=0, jitter=0, verbose=False):
+        self.jobs = jobs
+        self.writer = writer
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.parallel = parallel
+        self.per_service = per_service
+        self.jitter = jitter
+        self.verbose = verbose
+        self.running = []
+
+        now = time.time()
+        fractions = runner.offsets(['%s;%s' % (job.host, job.service)
+                                    for job in jobs])
+        for job, fraction in zip(jobs, fractions):
+            job.next_run = now + min_interval * fraction
+
+    def start_due(self, now):
+        due = sorted((j for j in self.jobs
+                      if not j.running and j.next_run <= now),
+                     key=lambda j: j.next_run)
+        for job in due:
+            if len(self.running) >= self.parallel:
+                break
+            if self.per_service:
+                service = runner.service(job.check)
+                if len([p for p in self.running
+                        if p.service == service]) >= self.per_service:
+                    continue
+            job.running = True
+            self.running.append(runner.CheckProcess(job.check, job.argv,
+                                                    job).start())
+
+    def finished(self, proc):
+        job = proc.job
+        job.running = False
+        output = proc.text()
+        try:
+            self.writer.write([(job.host, job.service, proc.code, output)])
+        except (IOError, OSError) as e:
+            sys.stderr.write('cannot submit passive result of %s;%s: %s\n'
+                             % (job.host, job.service, e))
+        job.schedule(proc.code, output, time.time(),
+                     self.min_interval, self.max_interval)
+        job.next_run += random.uniform(-self.jitter, self.jitter) * job.interval
+        if self.verbose:
+            print('%s;%s: %d, next run in %ds'
+                  % (job.host, job.service, proc.code, job.interval))
+            sys.stdout.flush()
+
+    def run_once(self):
+        now = time.time()
+        self.start_due(now)
+
+        timeout = None
+        if len(self.running) < self.parallel:
+            # jobs held back by --per-service wait for a check to finish
+            waiting = [j.next_run for j in self.jobs
+                       if not j.running and j.next_run > now]
+            if waiting:
+                timeout = min(waiting) - now
+        if not self.running:
+            time.sleep(timeout or 0)
+            return
+        ready, _, _ = select.select(self.running, [], [], timeout)
+        for proc in ready:
+            if not proc.read():
+                self.running.remove(proc)
+                self.finished(proc)
+
+    def run(self):
+        while True:
+            self.run_once()
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('batch_file',
+                      help='file with the checks to run')
+    argp.add_argument('--command-file', default=None,
+                      help='external command file of Nagios/Icinga')
+    argp.add_argument('--spool-dir', default=None,
+                      help='check result spool directory (check_result_path)')
+    argp.add_argument('--parallel', metavar='N', type=int, default=1,
+                      help='number of checks to run at the same time (default: 1)')
+    argp.add_argument('--min-interval', metavar='SECONDS', type=float, default=60,
+                      help='shortest interval of a check (default: 60)')
+    argp.add_argument('--max-interval', metavar='SECONDS', type=float, default=900,
+                      help='longest interval of a check (default: 900)')
+    argp.add_argument('--per-service', metavar='N', type=int, default=0,
+                      help='number of checks of the same service (e.g. nova) to run '
+                           'at the same time (default: 0, only limited by --parallel)')
+    argp.add_argument('--jitter', metavar='FRACTION', type=float, default=0.1,
+                      help='randomly shift every run by up to FRACTION of the '
+                           'interval (default: 0.1)')
+    argp.add_argument('-v', '--verbose', action='store_true', default=False,
+                      help='print the result and next interval of every run')
+    args = argp.parse_args()
+
+    writer = writer_from_args(args)
+    if writer is None:
+        argp.error('either --command-file or --spool-dir is required')
+    if args.min_interval > args.max_interval:
+        argp.error('--min-interval is larger than --max-interval')
+
+    with open(args.batch_file) as f:
+        jobs = [Job(check, argv, host, service, args.min_interval)
+                for check, argv, (host, service) in read_batch(f)]
+    if not jobs:
+        argp.error('no checks in %s' % args.batch_file)
+
+    scheduler = Scheduler(jobs, writer, args.min_interval, args.max_interval,
+                          parallel=args.parallel, per_service=args.per_service,
+                          jitter=args.jitter, verbose=args.verbose)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+  Check server which imports all checks and their OpenStack clients once,
+  listens on a unix socket and forks a child per requested check.
+
+  The check_* console scripts are thin clients: they forward argv,
+  environment and working directory to the server and relay its output
+  and exit code. If no server is listening they run the check in-process.
+"""
+
+from __future__ import absolute_import
+
+import argparse
+import errno
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from openstacknagios import runner
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser('~'), '.cache',
+                              'openstacknagios', 'server.sock')
+
+# checks reading their input from stdin
+STDIN_CHECKS = ('check_rally-results',)
+
+
+def socket_path():
+    return os.environ.get('OS_NAGIOS_SOCKET', DEFAULT_SOCKET)
+
+
+def read_message(conn):
+    data = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        data.append(chunk)
+    return json.loads(b''.join(data).decode('utf-8'))
+
+
+def preload():
+    """
+    Import everything a check needs, so forked children start warm.
+    """
+    for module in sorted(set(runner.CHECKS.values())):
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            sys.stderr.write('cannot preload %s: %s\n' % (module, e))
+    from keystoneauth1 import loading
+    import openstacknagios.openstacknagios as osnag
+    loading.get_plugin_loader(osnag.DEFAULT_AUTH_TYPE)
+
+
+def handle(conn):
+    """
+    Run the check requested on conn in this (forked) process and send back
+    its output and exit code.
+    """
+    request = read_message(conn)
+    os.environ.clear()
+    os.environ.update(request.get('env', {}))
+    if request.get('cwd'):
+        os.chdir(request['cwd'])
+    sys.stdin = StringIO(request.get('stdin') or '')
+
+    # capture fd 1 and 2, not only sys.stdout, to include the output of
+    # subprocesses (e.g. the ironic CLI) and C extensions
+    sys.stdout.flush()
+    sys.stderr.flush()
+    out = tempfile.TemporaryFile()
+    err = tempfile.TemporaryFile()
+    os.dup2(out.fileno(), 1)
+    os.dup2(err.fileno(), 2)
+    try:
+        code = runner.run_main(request['check'], request.get('argv', []))
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    response = dict(code=code)
+    for name, f in (('output', out), ('error', err)):
+        f.seek(0)
+        response[name] = f.read().decode('utf-8', 'replace')
+    conn.sendall(json.dumps(response).encode('utf-8'))
+
+
+def serve(path):
+    preload()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(old_umask)
+    sock.listen(128)
+
+    # let the kernel reap finished children
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    while True:
+        try:
+            conn, _ = sock.accept()
+        except socket.error as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                sock.close()
+                # checks using subprocess need to wait for their children
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                handle(conn)
+            except Exception:
+                code = 1
+            finally:
+                os._exit(code)
+        conn.close()
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('--socket', default=socket_path(),
+                      help='unix socket to listen on (default: env[OS_NAGIOS_SOCKET] '
+                           'or ~/.cache/openstacknagios/server.sock)')
+    args = argp.parse_args()
+    serve(args.socket)
+
+
+def client_main():
+    """
+    Entry point of the check_* console scripts.
+    """
+    name = os.path.basename(sys.argv[0])
+    argv = sys.argv[1:]
+
+    request = dict(check=name, argv=argv, env=dict(os.environ),
+                   cwd=os.getcwd())
+    if name in STDIN_CHECKS and '--result_file' not in argv:
+        request['stdin'] = sys.stdin.read()
+        sys.stdin = StringIO(request['stdin'])
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path())
+    except socket.error:
+        # no server running, run the check ourselves
+        sys.exit(runner.run_main(name, argv))
+
+    sock.sendall(json.dumps(request).encode('utf-8'))
+    sock.shutdown(socket.SHUT_WR)
+    try:
+        response = read_message(sock)
+    except (socket.error, ValueError) as e:
+        print('UNKNOWN - no response from check server: %s' % e)
+        sys.exit(3)
+    for name, stream in (('error', sys.stderr), ('output', sys.stdout)):
+        output = response.get(name) or ''
+        if str is bytes:
+            output = output.encode('utf-8')
+        stream.write(output)
+    sys.exit(response['code'])
+
+if __name__ == '__main__':
+    main()
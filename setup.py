@@ -78,29 +78,39 @@ setup(
         'python-cinderclient',
         'python-ceilometerclient',
         'python-ironicclient',
+        'os-client-config',
     ],
 
     # To provide executable scripts, use entry points in preference to the
     # "scripts" keyword. Entry points provide cross-platform support and allow
     # pip to create the appropriate form of executable for the target platform.
+    #
+    # The check_* scripts are thin clients of openstacknagios-server, which
+    # find the check to run by their name (see openstacknagios.runner.CHECKS)
+    # and run it in-process if no server is running.
     entry_points={
         'console_scripts': [
-            'check_nova-images=openstacknagios.nova.Images:main',
-            'check_nova-services=openstacknagios.nova.Services:main',
-            'check_nova-hypervisors=openstacknagios.nova.Hypervisors:main',
-            'check_cinder-services=openstacknagios.cinder.Services:main',
-            'check_neutron-agents=openstacknagios.neutron.Agents:main',
-            'check_neutron-floatingips=openstacknagios.neutron.Floatingips:main',
-            'check_neutron-networkipavailabilities=openstacknagios.neutron.Networkipavailabilities:main',
-            'check_neutron-routers=openstacknagios.neutron.Routers:main',
-            'check_keystone-token=openstacknagios.keystone.Token:main',
-            'check_keystone-endpoints=openstacknagios.keystone.Endpoints:main',
-            'check_ceilometer-statistics=openstacknagios.ceilometer.Statistics:main',
-            'check_gnocchi-metrics=openstacknagios.gnocchi.Metrics:main',
-            'check_gnocchi-status=openstacknagios.gnocchi.Status:main',
-            'check_rally-results=openstacknagios.rally.Results:main',
-            'check_ironic-nodes=openstacknagios.ironic.Nodes:main',
-            'check_ironic-node-consoles=openstacknagios.ironic.Consoles:main',
+            'check_nova-images=openstacknagios.server:client_main',
+            'check_nova-services=openstacknagios.server:client_main',
+            'check_nova-hypervisors=openstacknagios.server:client_main',
+            'check_nova-servers=openstacknagios.server:client_main',
+            'check_cinder-services=openstacknagios.server:client_main',
+            'check_neutron-agents=openstacknagios.server:client_main',
+            'check_neutron-floatingips=openstacknagios.server:client_main',
+            'check_neutron-networkipavailabilities=openstacknagios.server:client_main',
+            'check_neutron-routers=openstacknagios.server:client_main',
+            'check_keystone-token=openstacknagios.server:client_main',
+            'check_keystone-endpoints=openstacknagios.server:client_main',
+            'check_ceilometer-statistics=openstacknagios.server:client_main',
+            'check_gnocchi-metrics=openstacknagios.server:client_main',
+            'check_gnocchi-status=openstacknagios.server:client_main',
+            'check_gnocchi-statistics=openstacknagios.server:client_main',
+            'check_rally-results=openstacknagios.server:client_main',
+            'check_ironic-nodes=openstacknagios.server:client_main',
+            'check_ironic-node-consoles=openstacknagios.server:client_main',
+            'openstacknagios-passive=openstacknagios.passive:main',
+            'openstacknagios-server=openstacknagios.server:main',
+            'openstacknagios-scheduler=openstacknagios.scheduler:main',
         ],
     },
 )
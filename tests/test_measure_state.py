@@ -0,0 +1,97 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+  Tests of the periods seen by check_gnocchi-metrics --incremental.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+try:
+    from openstacknagios.gnocchi.Metrics import MeasureState
+except ImportError:
+    MeasureState = None
+
+# 2026-10-19 12:00:00 UTC
+T = 1792411200
+
+
+def measures(granularity, *offsets):
+    return [(datetime.utcfromtimestamp(T + offset), granularity, 1.0)
+            for offset in offsets]
+
+
+@unittest.skipIf(MeasureState is None, 'gnocchiclient is not installed')
+class MeasureStateTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.cache_dir, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_no_state(self):
+        state = MeasureState(self.filename)
+        self.assertEqual(state.starts('r', T), {})
+
+    def test_starts_per_granularity(self):
+        state = MeasureState(self.filename)
+        count = state.update('r', measures(300.0, 0, 300, 600, 900) +
+                                  measures(3600.0, 0), T)
+        self.assertEqual(count, 5)
+        # each granularity from its own last period
+        self.assertEqual(state.starts('r', T), {300.0: T + 900, 3600.0: T})
+
+    def test_saved(self):
+        state = MeasureState(self.filename)
+        state.update('r', measures(300.0, 0, 300), T)
+        state.save()
+        self.assertEqual(MeasureState(self.filename).starts('r', T),
+                         {300.0: T + 300})
+
+    def test_repeated_periods(self):
+        state = MeasureState(self.filename)
+        state.update('r', measures(300.0, 0, 300), T)
+        # the last period is requested again and only counted once
+        count = state.update('r', measures(300.0, 300, 600), T)
+        self.assertEqual(count, 3)
+
+    def test_window_moves(self):
+        state = MeasureState(self.filename)
+        state.update('r', measures(300.0, 0, 300, 600) +
+                          measures(3600.0, 0), T)
+        count = state.update('r', measures(300.0, 900), T + 600)
+        # the periods before the one the window starts in are dropped
+        self.assertEqual(count, 3)
+        self.assertEqual(state.starts('r', T + 600),
+                         {300.0: T + 900, 3600.0: T + 600})
+
+    def test_empty_granularity_kept(self):
+        state = MeasureState(self.filename)
+        state.update('r', measures(300.0, 0) + measures(3600.0, 0), T)
+        count = state.update('r', [], T + 1800)
+        self.assertEqual(count, 1)
+        # without periods left the granularity is requested from the
+        # window start
+        self.assertEqual(state.starts('r', T + 1800),
+                         {300.0: T + 1800, 3600.0: T + 1800})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+  Tests of the state kept by check_nova-servers between runs.
+"""
+
+import unittest
+
+from openstacknagios.nova.Servers import NovaServers, bad_state
+
+
+class FakeAuth(object):
+    auth_url = 'http://keystone.example.com:5000/v3'
+
+
+class FakeSession(object):
+    def __init__(self, project_id, user_id):
+        self.project_id = project_id
+        self.user_id = user_id
+
+    def get_project_id(self):
+        return self.project_id
+
+    def get_user_id(self):
+        return self.user_id
+
+
+def servers(project_id='p', user_id='u', region_name='RegionOne',
+            all_tenants=False):
+    resource = NovaServers.__new__(NovaServers)
+    resource.auth_plugin = FakeAuth()
+    resource.session = FakeSession(project_id, user_id)
+    resource.region_name = region_name
+    resource.interface = None
+    resource.all_tenants = all_tenants
+    resource.cache_dir = '/cache'
+    return resource
+
+
+class StateFilenameTest(unittest.TestCase):
+    def test_same_scope(self):
+        self.assertEqual(servers()._state_filename(), servers()._state_filename())
+
+    def test_project(self):
+        self.assertNotEqual(servers()._state_filename(),
+                            servers(project_id='q')._state_filename())
+
+    def test_user(self):
+        self.assertNotEqual(servers()._state_filename(),
+                            servers(user_id='v')._state_filename())
+
+    def test_region(self):
+        self.assertNotEqual(servers()._state_filename(),
+                            servers(region_name='RegionTwo')._state_filename())
+
+    def test_all_tenants(self):
+        self.assertNotEqual(servers()._state_filename(),
+                            servers(all_tenants=True)._state_filename())
+
+
+class BadStateTest(unittest.TestCase):
+    def test_states(self):
+        self.assertEqual(bad_state(dict(status='ERROR')), 'error')
+        self.assertEqual(bad_state(dict(status='BUILD')), 'build')
+        self.assertEqual(bad_state(dict(status='ACTIVE',
+                                        **{'OS-EXT-STS:task_state': 'deleting'})),
+                         'deleting')
+        self.assertEqual(bad_state(dict(status='ACTIVE')), None)
+        # deleted servers of changes-since leave the bad states
+        self.assertEqual(bad_state(dict(status='DELETED',
+                                        **{'OS-EXT-STS:task_state': 'deleting'})),
+                         None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+  Tests of paginate() against a fake session serving a list of items.
+"""
+
+import unittest
+
+import openstacknagios.openstacknagios as osnag
+
+
+class FakeResponse(object):
+    def __init__(self, body):
+        self.body = body
+        self.headers = {}
+
+    def json(self):
+        return self.body
+
+
+class FakeSession(object):
+    """
+    Serves count items with the limit/marker convention, with next links
+    if links is set. ignore_marker serves the first page again and again.
+    """
+    def __init__(self, count, links=False, ignore_marker=False):
+        self.items = [dict(id='item-%04d' % i) for i in range(count)]
+        self.links = links
+        self.ignore_marker = ignore_marker
+        self.requests = []
+
+    def get(self, url, params=None, **kwargs):
+        self.requests.append((url, params, kwargs))
+        if '?' in url:
+            url, query = url.split('?', 1)
+            params = dict(arg.split('=', 1) for arg in query.split('&'))
+        limit = int(params['limit'])
+        start = 0
+        if params.get('marker') and not self.ignore_marker:
+            start = [item['id'] for item in self.items].index(params['marker']) + 1
+        body = dict(items=self.items[start:start + limit])
+        if self.links and start + limit < len(self.items):
+            body['items_links'] = [dict(
+                rel='next', href='%s?limit=%d&marker=%s'
+                % (url, limit, self.items[start + limit - 1]['id']))]
+        return FakeResponse(body)
+
+
+class PaginateTest(unittest.TestCase):
+    def test_marker(self):
+        session = FakeSession(25)
+        items = list(osnag.paginate(session, '/items', 'items', page_size=10))
+        self.assertEqual(items, session.items)
+        self.assertEqual([params for url, params, kwargs in session.requests],
+                         [dict(limit=10),
+                          dict(limit=10, marker='item-0009'),
+                          dict(limit=10, marker='item-0019')])
+
+    def test_full_last_page(self):
+        session = FakeSession(20)
+        items = list(osnag.paginate(session, '/items', 'items', page_size=10))
+        self.assertEqual(items, session.items)
+        # the empty page after the full last one ends the listing
+        self.assertEqual(len(session.requests), 3)
+
+    def test_next_links(self):
+        session = FakeSession(25, links=True)
+        items = list(osnag.paginate(session, '/items', 'items', page_size=10,
+                                    params=dict(host='a')))
+        self.assertEqual(items, session.items)
+        self.assertEqual(session.requests[0][1], dict(limit=10, host='a'))
+        self.assertEqual(session.requests[1][0], '/items?limit=10&marker=item-0009')
+        self.assertEqual(session.requests[1][1], None)
+        self.assertEqual(len(session.requests), 3)
+
+    def test_full_last_page_after_link(self):
+        session = FakeSession(20, links=True)
+        items = list(osnag.paginate(session, '/items', 'items', page_size=10))
+        self.assertEqual(items, session.items)
+        # the link of the first page holds the marker, it is not added twice
+        self.assertEqual(len(session.requests), 2)
+
+    def test_ignored_marker(self):
+        session = FakeSession(25, ignore_marker=True)
+        items = list(osnag.paginate(session, '/items', 'items', page_size=10))
+        self.assertEqual(items, session.items[:10])
+        self.assertEqual(len(session.requests), 2)
+
+    def test_one_page_at_a_time(self):
+        session = FakeSession(25)
+        items = osnag.paginate(session, '/items', 'items', page_size=10)
+        for i in range(10):
+            next(items)
+        # the next page is only requested once the items of the first
+        # one are consumed
+        self.assertEqual(len(session.requests), 1)
+        next(items)
+        self.assertEqual(len(session.requests), 2)
+
+    def test_on_response_and_kwargs(self):
+        session = FakeSession(15)
+        responses = []
+        list(osnag.paginate(session, '/items', 'items', page_size=10,
+                            on_response=responses.append,
+                            endpoint_filter=dict(service_type='network')))
+        self.assertEqual([r.body['items'][0]['id'] for r in responses],
+                         ['item-0000', 'item-0010'])
+        self.assertEqual([kwargs for url, params, kwargs in session.requests],
+                         [dict(endpoint_filter=dict(service_type='network'))] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+  Regression tests running checks against traffic recorded with --record
+  and replayed with --replay (see tests/fixtures).
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(module, argv, cache_dir, stdin=None):
+    """
+    Run the check module with the given arguments, returns the exit code
+    and the output.
+    """
+    # no OS_* variables of the caller, the fixture holds all traffic
+    env = dict((k, v) for k, v in os.environ.items()
+               if not k.startswith('OS_'))
+    env['PYTHONPATH'] = ROOT
+    cmd = [sys.executable, '-m', module,
+           '--os-auth-url', 'http://keystone.example.com:5000/v3',
+           '--os-auth-type', 'token', '--os-token', 'replayed',
+           '--os-project-id', 'p', '--os-region-name', 'RegionOne',
+           '--cache-dir', cache_dir] + list(argv)
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, env=env)
+    output = proc.communicate(stdin)[0].decode('utf-8')
+    return proc.returncode, output
+
+
+def run_check(module, fixture, *argv):
+    """
+    Run the check module against the replayed fixture, returns the exit
+    code and the output.
+    """
+    cache_dir = tempfile.mkdtemp()
+    try:
+        return run(module, ['--replay', os.path.join(FIXTURES, fixture)] + list(argv),
+                   cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def perfdata(output):
+    return dict(item.split('=', 1) for item in
+                output.splitlines()[0].split('|', 1)[1].split())
+
+
+class NeutronAgentsReplayTest(unittest.TestCase):
+    """
+    neutron-agents.json: 5 agents listed in pages of 2, 3 up, 1 disabled
+    and 1 down.
+    """
+    def test_counts(self):
+        code, output = run_check('openstacknagios.neutron.Agents',
+                                 'neutron-agents.json', '--page-size', '2')
+        self.assertEqual(code, 2, output)
+        self.assertTrue(output.startswith('NEUTRONAGENTS CRITICAL - down is 1'),
+                        output)
+        metrics = perfdata(output)
+        self.assertEqual(metrics['total'], '5;;@0;0')
+        self.assertEqual(metrics['up'], '3;;;0')
+        self.assertEqual(metrics['disabled'], '1;@1:;;0')
+        self.assertEqual(metrics['down'], '1;;0;0')
+
+    def test_down_allowed(self):
+        code, output = run_check('openstacknagios.neutron.Agents',
+                                 'neutron-agents.json', '--page-size', '2',
+                                 '--critical_down', '0:1',
+                                 '--warn_disabled', '0:')
+        self.assertEqual(code, 0, output)
+        self.assertTrue(output.startswith('NEUTRONAGENTS OK'), output)
+
+
+class CinderServicesReplayTest(unittest.TestCase):
+    """
+    cinder-services.json: 4 services, 2 up, 1 disabled and 1 down.
+    """
+    def setUp(self):
+        try:
+            import cinderclient
+        except ImportError:
+            self.skipTest('cinderclient is not installed')
+
+    def test_counts(self):
+        code, output = run_check('openstacknagios.cinder.Services',
+                                 'cinder-services.json')
+        self.assertEqual(code, 2, output)
+        self.assertTrue(output.startswith('CINDERSERVICES CRITICAL - down is 1'),
+                        output)
+        metrics = perfdata(output)
+        self.assertEqual(metrics['total'], '4;;@0;0')
+        self.assertEqual(metrics['up'], '2;;;0')
+        self.assertEqual(metrics['disabled'], '1;@1:;;0')
+        self.assertEqual(metrics['down'], '1;;0;0')
+
+    def test_per_host(self):
+        code, output = run_check('openstacknagios.cinder.Services',
+                                 'cinder-services.json', '--per_host',
+                                 '--critical_down', '0:1',
+                                 '--warn_disabled', '0:')
+        self.assertEqual(code, 2, output)
+        metrics = perfdata(output)
+        self.assertEqual(metrics["'cinder-volume:storage1@lvm'"], '0;0;1;0;2')
+        self.assertEqual(metrics["'cinder-volume:storage2@ceph'"], '2;0;1;0;2')
+        self.assertEqual(metrics["'cinder-backup:storage1'"], '1;0;1;0;2')
+
+
+class NovaServersReplayTest(unittest.TestCase):
+    """
+    nova-servers.json: a full listing of 4 servers in pages of 3, 1 in error, 1 building
+    and 1 being deleted, then the changes since: the server in error was
+    deleted, the building one became active and another one went into
+    error.
+    """
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def check(self, *argv):
+        # the ages depend on the time of the test run, only the counts are
+        # evaluated
+        code, output = run('openstacknagios.nova.Servers',
+                           ['--replay', os.path.join(FIXTURES, 'nova-servers.json'),
+                            '--page-size', '3',
+                            '--warn_build_age', '0:', '--critical_build_age', '0:',
+                            '--warn_deleting_age', '0:', '--critical_deleting_age', '0:']
+                           + list(argv), self.cache_dir)
+        self.assertEqual(code, 0, output)
+        return perfdata(output)
+
+    def test_changes_since(self):
+        metrics = self.check()
+        self.assertEqual([metrics[name].split(';')[0] for name in
+                          ('error', 'build', 'deleting', 'changes')],
+                         ['1', '1', '1', '4'])
+        # the second run only requests the changes since the first listing
+        metrics = self.check()
+        self.assertEqual([metrics[name].split(';')[0] for name in
+                          ('error', 'build', 'deleting', 'changes')],
+                         ['1', '0', '1', '3'])
+
+    def test_resync(self):
+        self.check()
+        # the full listing is requested again
+        metrics = self.check('--resync', '0')
+        self.assertEqual(metrics['changes'].split(';')[0], '4')
+
+
+class RallyResultsTest(unittest.TestCase):
+    """
+    rally-results.json: 2 scenarios, one iteration of the second failed
+    and so did its SLA.
+    """
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        with open(os.path.join(FIXTURES, 'rally-results.json'), 'rb') as f:
+            self.results = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_stdin(self):
+        code, output = run('openstacknagios.rally.Results', [], self.cache_dir,
+                           stdin=self.results)
+        self.assertEqual(code, 2, output)
+        metrics = perfdata(output)
+        self.assertEqual(metrics['total'], '2')
+        self.assertEqual(metrics['errors'], '1;0;0')
+        self.assertEqual(metrics['slafail'], '1;0;0')
+        self.assertEqual(metrics['fulldur'], '92.5s')
+        self.assertEqual(metrics['loaddur'], '79.5s')
+
+    def test_result_file(self):
+        code, output = run('openstacknagios.rally.Results',
+                           ['--result_file', os.path.join(FIXTURES, 'rally-results.json'),
+                            '-w', ':1', '-c', ':1',
+                            '--warn_slafail', ':1', '--critical_slafail', ':1'],
+                           self.cache_dir)
+        self.assertEqual(code, 0, output)
+        self.assertTrue(output.startswith('RALLYRESULTS OK'), output)
+
+
+if __name__ == '__main__':
+    unittest.main()